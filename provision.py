@@ -5,136 +5,2531 @@ Provisions AI-specific configurations and project types based on user selection.
 """
 
 import argparse
+import atexit
+import codecs
+import errno
+import fnmatch
+import hashlib
+import json
+import marshal
+import mmap
 import os
+import re
+import select
 import shutil
+import struct
 import subprocess
+import sys
+import threading
+import time
+import zlib
+# concurrent.futures resolves its executors lazily; the process one costs ~30 ms to import
+from concurrent import futures
+from contextlib import contextmanager, nullcontext
 from datetime import datetime
 from pathlib import Path
+from stat import S_ISREG
+from types import SimpleNamespace
 
-try:
-    import yaml
-except ImportError:
-    print("Error: PyYAML is required. Install it with: pip install PyYAML")
-    exit(1)
 
+DEFAULT_TEXT_EXTENSIONS = ['.md', '.yml', '.yaml', '.json', '.js', '.ts', '.py', '.prompt']
+DEFAULT_BINARY_EXTENSIONS = ['.png', '.jpg', '.jpeg', '.gif', '.ico', '.pdf']
+EXECUTOR_TYPES = ('thread', 'process')
+LINK_MODES = ('copy', 'hardlink', 'symlink', 'reflink')
+LINK_LABELS = {'copy': 'Copied', 'hardlink': 'Hardlinked', 'symlink': 'Symlinked', 'reflink': 'Cloned'}
+FICLONE = 0x40049409  # Linux ioctl that shares extents between two files (btrfs, XFS, ...)
+AT_FDCWD = -100
+RENAME_EXCHANGE = 1 << 1  # renameat2 flag: atomically swap two existing paths
+STAGING_SUFFIX = '.provision-staging'  # Sibling directory cleaned targets are rebuilt in
+IN_NONBLOCK = 0o4000  # inotify_init1 flags and event masks (linux/inotify.h)
+IN_CLOEXEC = 0o2000000
+IN_MODIFY = 0x2
+IN_ATTRIB = 0x4
+IN_CLOSE_WRITE = 0x8
+IN_MOVED_FROM = 0x40
+IN_MOVED_TO = 0x80
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_Q_OVERFLOW = 0x4000
+IN_IGNORED = 0x8000
+IN_ISDIR = 0x40000000
+WATCH_MASK = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+WATCH_DEBOUNCE = 0.1  # Seconds without further changes before a batch is applied
+WATCH_POLL_INTERVAL = 0.5  # Rescan interval of the mtime-polling fallback
+LOCK_NAME = 'provision.lock'  # Pinned git commits, next to provision.py
+LOCK_VERSION = 1
+STREAM_CHUNK_SIZE = 1 << 20
+DEFAULT_STREAM_THRESHOLD = 8 * STREAM_CHUNK_SIZE  # Larger text files are substituted in chunks
+MANIFEST_NAME = '.provision-manifest.json'
+PROVISION_CACHE_DIR = '.provision_cache'
+SOURCE_INDEX_NAME = 'source-index.json'
+SOURCE_INDEX_VERSION = 1
+STAT_CACHE_NAME = 'stat-cache.json'  # Path -> size, mtime_ns, inode, hash of files update compares
+STAT_CACHE_VERSION = 1
+STAT_CACHE_RACY_NS = 2 * 10**9  # Files modified this recently may change again within the same mtime
+WALK_PRUNE_DIRS = frozenset({'.git', '.hg', '.svn', '__pycache__', PROVISION_CACHE_DIR})  # Never walked into
+SNIFF_BYTES = 8192  # What a text-mode read(1024) decodes from disk at most
+PLACEHOLDER_BYTES_PATTERN = re.compile(rb'\{\{([^{}\r\n]{1,256})\}\}')
+PLACEHOLDER_MAX_BYTES = 2 + 256 + 2  # Longest match of PLACEHOLDER_BYTES_PATTERN
+MANIFEST_VERSION = 1
+TEMPLATE_RECORD_NAME = 'template-update.json'  # Last applied template commit and file hashes
+TEMPLATE_RECORD_VERSION = 1
+BACKUP_DIR_NAME = 'backups'  # Snapshot store under .provision_cache
+BACKUP_VERSION = 1
+BACKUP_COMPRESSION_LEVEL = 6
+BACKUP_KEEP = 10  # Snapshots kept by default; older ones are pruned after each update
+CONFIG_CACHE_DIR_NAME = 'config'  # Compiled YAML configs under .provision_cache
+CONFIG_CACHE_VERSION = 1
+CONFIG_SECTIONS = {  # Top-level sections that must be mappings, per config file
+    'map.yaml': ('project_types', 'targets', 'template_vars'),
+    'provision.map.yaml': ('ai_tools', 'git_repos', 'settings', 'concurrent_support'),
+    'external-resources.map.yaml': ('repos',),
+}
+
+
+def default_job_count():
+    """Default worker count for the file-copy pool (I/O bound, so oversubscribe the CPUs)"""
+    return min(32, (os.cpu_count() or 1) + 4)
+
+
+def _is_text_path(file_path, text_extensions, binary_extensions, sniffed=None):
+    """Determine if a file should be treated as text for variable substitution.
+
+    ``sniffed`` is a cached result of the UTF-8 sniff for unknown extensions.
+    """
+    file_ext = file_path.suffix.lower()
+
+    if file_ext in binary_extensions:
+        return False
+    if file_ext in text_extensions:
+        return True
+    if sniffed is not None:
+        return sniffed
+
+    # Default: try to detect if file is text
+    try:
+        with open(file_path, 'r', encoding='utf-8') as f:
+            f.read(1024)  # Read first 1KB to test
+        return True
+    except (UnicodeDecodeError, PermissionError):
+        return False
+
+
+class VariableSubstituter:
+    """Single-pass {{KEY}} substitution compiled once for a set of template variables.
+
+    One regex scan resolves every placeholder through a dict lookup, so the cost
+    no longer grows with the number of variables. Identifier-like placeholders
+    without a value are left untouched and can be reported as unknown.
+    """
+
+    IDENTIFIER = r'[A-Za-z_][A-Za-z0-9_]*'
+
+    # Longest tail held back between stream chunks when looking for a split placeholder
+    MIN_HOLDBACK = 256
+
+    def __init__(self, variables):
+        self.values = {str(key): str(value) for key, value in variables.items()}
+        self.holdback = max([self.MIN_HOLDBACK] + [len(key) + 4 for key in self.values])
+        # Keys that aren't plain identifiers still need an exact match; longest first
+        extra_keys = sorted(
+            (key for key in self.values if not re.fullmatch(self.IDENTIFIER, key)),
+            key=len, reverse=True
+        )
+        alternatives = [re.escape(key) for key in extra_keys] + [self.IDENTIFIER]
+        self.pattern = re.compile(r'\{\{(' + '|'.join(alternatives) + r')\}\}')
+
+    def references(self, names):
+        """Split placeholder names found in a file into (used values, unknown identifiers)"""
+        used = {}
+        unknown = []
+        for name in names:
+            value = self.values.get(name)
+            if value is not None:
+                used[name] = value
+            elif re.fullmatch(self.IDENTIFIER, name):
+                unknown.append(name)
+        return used, unknown
+
+    def substitute(self, content, unknown=None):
+        """Return content with known placeholders replaced; unknown names are added to ``unknown``"""
+        if not isinstance(content, str) or '{{' not in content:
+            return content
+        values = self.values
+
+        def replace(match):
+            key = match.group(1)
+            value = values.get(key)
+            if value is None:
+                if unknown is not None:
+                    unknown.add(key)
+                return match.group(0)
+            return value
+
+        return self.pattern.sub(replace, content)
+
+    def substitute_chunks(self, chunks, unknown=None):
+        """Substitute an iterable of text chunks, yielding output chunks.
+
+        A possible placeholder at the end of a chunk (an unclosed ``{{`` or a
+        trailing ``{``) is carried into the next one, so ``{{KEY}}`` split across
+        a chunk boundary is still replaced and memory stays bounded by the chunk size.
+        """
+        carry = ''
+        for chunk in chunks:
+            buffer = carry + chunk
+            cut = len(buffer)
+            start = buffer.rfind('{{')
+            if start != -1 and '}}' not in buffer[start + 2:] and cut - start <= self.holdback:
+                cut = start
+            elif buffer.endswith('{'):
+                cut -= 1
+            if cut:
+                yield self.substitute(buffer[:cut], unknown)
+            carry = buffer[cut:]
+        if carry:
+            yield self.substitute(carry, unknown)
+
+
+class FileRenamer:
+    """A mapping's file_transforms compiled into one memoized file-name rename.
+
+    Rules are tried in order and the first one that matches a name wins:
+    from_extension/to_extension swaps a name suffix, from_pattern/to_pattern
+    rewrites the name with a regex (``$1`` and ``\\1`` both name groups).
+    preserve_all keeps every name unchanged and a bare preserve_others keeps
+    names no earlier rule matched; either ends the rule list.
+    """
+
+    def __init__(self, transforms):
+        self.rules = []
+        for transform in transforms or []:
+            if transform.get('preserve_all', False):
+                self.rules.append(('stop', None, None))
+            elif 'from_extension' in transform and 'to_extension' in transform:
+                self.rules.append(('extension', transform['from_extension'], transform['to_extension']))
+            elif 'from_pattern' in transform and 'to_pattern' in transform:
+                replacement = re.sub(r'\$(\d+)|\$\{(\d+)\}', lambda m: f"\\g<{m.group(1) or m.group(2)}>",
+                                     transform['to_pattern'])
+                self.rules.append(('pattern', re.compile(transform['from_pattern']), replacement))
+            elif transform.get('preserve_others', False):
+                self.rules.append(('stop', None, None))
+        self._names = {}
+
+    def rename(self, name):
+        """Target file name for a source file name"""
+        new_name = self._names.get(name)
+        if new_name is None:
+            new_name = self._names[name] = self._apply(name)
+        return new_name
+
+    def _apply(self, name):
+        for kind, match, replacement in self.rules:
+            if kind == 'stop':
+                break
+            if kind == 'extension':
+                if name.endswith(match):
+                    return name[:len(name) - len(match)] + replacement
+            else:
+                new_name, count = match.subn(replacement, name)
+                if count:
+                    return new_name
+        return name
+
+    def target(self, source_name, target_file):
+        """Apply the rename to target_file, which mirrors a source file called source_name"""
+        if not self.rules:
+            return target_file
+        new_name = self.rename(source_name)
+        return target_file if new_name == source_name else target_file.parent / new_name
+
+
+class ConfigDict(dict):
+    """Read-only dict for parsed configuration, which every caller in the process shares"""
+
+    def _read_only(self, *args, **kwargs):
+        raise TypeError("Configuration is read-only; change a copy() instead")
+
+    __setitem__ = __delitem__ = __ior__ = _read_only
+    clear = pop = popitem = setdefault = update = _read_only
+
+    def __reduce__(self):
+        return ConfigDict, (dict(self),)
+
+
+_config_memo = {}  # Path -> (size, mtime_ns, frozen config): each file is parsed once per process
+
+
+def _freeze_config(value):
+    """Parsed YAML as ConfigDicts and tuples"""
+    if isinstance(value, dict):
+        return ConfigDict((key, _freeze_config(item)) for key, item in value.items())
+    if isinstance(value, list):
+        return tuple(_freeze_config(item) for item in value)
+    return value
+
+
+def _parse_yaml(text, name):
+    """safe_load semantics, with the libyaml-backed loader when PyYAML was built with it.
+
+    Syntax errors are raised as ValueError naming the file.
+    """
+    try:
+        import yaml
+    except ImportError:
+        print("Error: PyYAML is required. Install it with: pip install PyYAML")
+        exit(1)
+    try:
+        return yaml.load(text, Loader=getattr(yaml, 'CSafeLoader', yaml.SafeLoader))
+    except yaml.YAMLError as e:
+        raise ValueError(f"{name}: invalid YAML: {e}") from e
+
+
+def _validate_config(name, data):
+    """Check the structure provision.py relies on, raising ValueError naming the bad entry"""
+    if data is None:
+        return
+    if not isinstance(data, dict):
+        raise ValueError(f"{name}: expected a mapping at the top level")
+    for section in CONFIG_SECTIONS.get(name, ()):
+        if not isinstance(data.get(section) or {}, dict):
+            raise ValueError(f"{name}: '{section}' must be a mapping")
+    for key, project in (data.get('project_types') or {}).items():
+        if not isinstance(project, dict) or not isinstance(project.get('files', []), list):
+            raise ValueError(f"{name}: project_types.{key} must be a mapping with a 'files' list")
+        for file_config in project.get('files', []):
+            if not isinstance(file_config, dict) or 'from' not in file_config or 'to' not in file_config:
+                raise ValueError(f"{name}: project_types.{key}.files entries need 'from' and 'to'")
+    for key, tool in (data.get('ai_tools') or {}).items():
+        if not isinstance(tool, dict) or not isinstance(tool.get('target_base'), str):
+            raise ValueError(f"{name}: ai_tools.{key} must be a mapping with a 'target_base' string")
+        for mapping in tool.get('mappings') or []:
+            if not isinstance(mapping, dict) or 'source' not in mapping or 'target' not in mapping:
+                raise ValueError(f"{name}: ai_tools.{key}.mappings entries need 'source' and 'target'")
+        if not isinstance(tool.get('git_repo_mappings') or {}, dict):
+            raise ValueError(f"{name}: ai_tools.{key}.git_repo_mappings must be a mapping")
+    for section in ('git_repos', 'repos'):
+        for key, repo in (data.get(section) or {}).items():
+            if not isinstance(repo, dict) or not isinstance(repo.get('url'), str):
+                raise ValueError(f"{name}: {section}.{key} must be a mapping with a 'url' string")
+
+
+def _read_config_cache(cache_path):
+    """(stat key, content hash, data) from a compiled config, or None if missing or stale"""
+    try:
+        with open(cache_path, 'rb') as f:
+            cached = marshal.load(f)
+    except (OSError, EOFError, ValueError, TypeError):
+        return None
+    if (not isinstance(cached, tuple) or len(cached) != 5 or cached[0] != CONFIG_CACHE_VERSION
+            or cached[1] != sys.implementation.cache_tag):
+        return None
+    return cached[2:]
+
+
+def _write_config_cache(cache_path, key, digest, data):
+    """Best effort: a config marshal cannot encode (e.g. YAML timestamps) is just not cached"""
+    try:
+        encoded = marshal.dumps((CONFIG_CACHE_VERSION, sys.implementation.cache_tag, key, digest, data))
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = cache_path.with_name(f"{cache_path.name}.tmp.{os.getpid()}")
+        with open(temp_path, 'wb') as f:
+            f.write(encoded)
+        os.replace(temp_path, cache_path)
+    except (OSError, ValueError):
+        pass
+
+
+def load_yaml_config(path, cache_dir=None, write_cache=True):
+    """Load a YAML config file as validated, read-only objects (ConfigDict, tuples).
+
+    Each file is parsed at most once per process. With cache_dir, the parsed data is also
+    kept on disk, marshalled, keyed by size/mtime and then by content hash, so later runs
+    import neither PyYAML nor parse anything while the file is unchanged. Without
+    write_cache (dry runs) an existing cache is read but never created or refreshed.
+    """
+    path = Path(path)
+    key = _stat_key(path.stat())
+    memo = _config_memo.get(path)
+    if memo is not None and memo[0] == key:
+        return memo[1]
+    
+    cache_path = Path(cache_dir) / f"{path.name}.marshal" if cache_dir else None
+    cached = _read_config_cache(cache_path) if cache_path else None
+    if cached is not None and cached[0] == key:
+        data = cached[2]
+    else:
+        raw = path.read_bytes()
+        digest = hashlib.sha256(raw).hexdigest()
+        if cached is not None and cached[1] == digest:
+            # Touched but unchanged
+            data = cached[2]
+        else:
+            data = _parse_yaml(raw.decode('utf-8'), path.name)
+            _validate_config(path.name, data)
+        if cache_path and write_cache:
+            _write_config_cache(cache_path, key, digest, data)
+    
+    config = _freeze_config(data)
+    _config_memo[path] = (key, config)
+    return config
+
+
+def hash_variables(variables):
+    """Stable hash of a template variable dict, used to detect variable changes between runs"""
+    encoded = json.dumps(variables, sort_keys=True, default=str).encode('utf-8')
+    return hashlib.sha256(encoded).hexdigest()
+
+
+def _hash_file(path):
+    """SHA-256 of a file's contents, read in 1 MB chunks"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _scandir_sorted(directory):
+    """Entries of a directory sorted by name (none if it can't be listed)"""
+    try:
+        with os.scandir(directory) as entries:
+            return sorted(entries, key=lambda entry: entry.name)
+    except OSError:
+        return []
+
+
+def _is_pruned_dir(name, prune=WALK_PRUNE_DIRS):
+    return name in prune or name.endswith(STAGING_SUFFIX)
+
+
+def walk_files(root, prune=WALK_PRUNE_DIRS):
+    """Regular files under root as (path, DirEntry) pairs, in the order of sorted(root.rglob('*')).
+
+    One scandir per directory: the entries' file types come with the listing and their
+    stat() is cached, so callers don't pay extra is_file()/stat() calls per file.
+    Directories named in prune, staging directories and symlinked directories are skipped.
+    """
+    stack = [iter(_scandir_sorted(root))]
+    while stack:
+        entry = next(stack[-1], None)
+        if entry is None:
+            stack.pop()
+        elif entry.is_dir(follow_symlinks=False):
+            if not _is_pruned_dir(entry.name, prune):
+                stack.append(iter(_scandir_sorted(entry.path)))
+        elif entry.is_file():
+            yield Path(entry.path), entry
+
+
+class StatCache:
+    """Persistent path -> (size, mtime_ns, inode, sha256) map.
+
+    hash() only reads files whose stat changed since they were last hashed. Paths under
+    root are stored relative to it, so the cache survives moving the checkout.
+    """
+
+    def __init__(self, path, root):
+        self.path = Path(path)
+        self.root = str(root) + os.sep
+        self.files = None
+        self.dirty = False
+
+    def _load(self):
+        self.files = {}
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if isinstance(data, dict) and data.get('version') == STAT_CACHE_VERSION:
+                self.files = data.get('files', {})
+        except (OSError, ValueError):
+            pass
+
+    def _key(self, path):
+        path = str(path)
+        return path[len(self.root):] if path.startswith(self.root) else path
+
+    def hash(self, path, stat_result=None):
+        """SHA-256 of a file, from the cache when its size, mtime and inode are unchanged"""
+        if self.files is None:
+            self._load()
+        if stat_result is None:
+            stat_result = os.stat(path)
+        key = self._key(path)
+        stamp = [stat_result.st_size, stat_result.st_mtime_ns, stat_result.st_ino]
+        entry = self.files.get(key)
+        if entry and entry[:3] == stamp:
+            return entry[3]
+        digest = _hash_file(path)
+        self.record(path, digest, stat_result)
+        return digest
+
+    def record(self, path, digest, stat_result=None):
+        """Remember the hash of a file just written (or forget it if it may still change unseen)"""
+        if self.files is None:
+            self._load()
+        if stat_result is None:
+            stat_result = os.stat(path)
+        key = self._key(path)
+        if stat_result.st_mtime_ns < time.time_ns() - STAT_CACHE_RACY_NS:
+            self.files[key] = [stat_result.st_size, stat_result.st_mtime_ns, stat_result.st_ino, digest]
+            self.dirty = True
+        elif self.files.pop(key, None) is not None:
+            self.dirty = True
+
+    def save(self):
+        """Atomically write the cache if hash() added or refreshed entries"""
+        if not self.dirty:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = self.path.with_name(f"{self.path.name}.tmp")
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            f.write(json.dumps({'version': STAT_CACHE_VERSION, 'files': self.files},
+                               sort_keys=True, separators=(',', ':')))
+        os.replace(temp_path, self.path)
+        self.dirty = False
+
+
+def _regular_stat(path):
+    """stat() of a regular file (following symlinks), None for anything else or nothing"""
+    try:
+        stat_result = os.stat(path)
+    except OSError:
+        return None
+    return stat_result if S_ISREG(stat_result.st_mode) else None
+
+
+def _stat_key(stat_result):
+    """The (size, mtime_ns) pair recorded in manifests to avoid re-hashing untouched files"""
+    return [stat_result.st_size, stat_result.st_mtime_ns]
+
+
+def _decode_text(data):
+    """Decode UTF-8 bytes the way text-mode open() does (universal newlines)"""
+    return data.decode('utf-8').replace('\r\n', '\n').replace('\r', '\n')
+
+
+def _encode_text(content):
+    """Encode text the way text-mode open() writes it (platform line endings)"""
+    if os.linesep != '\n':
+        content = content.replace('\n', os.linesep)
+    return content.encode('utf-8')
+
+
+def _iter_text_chunks(source_file, source_digest, chunk_size=STREAM_CHUNK_SIZE):
+    """Decode a binary file incrementally with universal newlines, hashing the raw bytes"""
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    pending_cr = ''
+    while True:
+        data = source_file.read(chunk_size)
+        source_digest.update(data)
+        text = pending_cr + decoder.decode(data, final=not data)
+        # A trailing \r may be the first half of a \r\n split across reads
+        pending_cr = '\r' if data and text.endswith('\r') else ''
+        if pending_cr:
+            text = text[:-1]
+        if text:
+            yield text.replace('\r\n', '\n').replace('\r', '\n')
+        if not data:
+            return
+
+
+def _render_text(source, target, substituter, unknown, data=None):
+    """Substitute a text file (or its already-read bytes) in memory.
+
+    Returns (source_hash, output_hash) or None if not UTF-8.
+    """
+    if data is None:
+        with open(source, 'rb') as f:
+            data = f.read()
+    try:
+        content = _decode_text(data)
+    except UnicodeDecodeError:
+        return None
+    output = _encode_text(substituter.substitute(content, unknown))
+    with open(target, 'wb') as f:
+        f.write(output)
+    return hashlib.sha256(data).hexdigest(), hashlib.sha256(output).hexdigest()
+
+
+def _render_text_streaming(source, target, substituter, unknown, chunk_size=STREAM_CHUNK_SIZE, blob=None):
+    """Substitute a large text file (or git blob) chunk by chunk through a buffered writer.
+
+    Output goes to a temporary sibling that replaces the target only once the
+    whole file decoded, so a binary file detected mid-stream leaves no partial
+    output. Returns (source_hash, output_hash) or None if not UTF-8.
+    """
+    source_digest = hashlib.sha256()
+    output_digest = hashlib.sha256()
+    temp_path = target.with_name(f".{target.name}.provision-tmp")
+    try:
+        with (_open_blob(blob) if blob else open(source, 'rb')) as src, \
+                open(temp_path, 'wb', buffering=chunk_size) as dst:
+            for text in substituter.substitute_chunks(_iter_text_chunks(src, source_digest, chunk_size), unknown):
+                data = _encode_text(text)
+                output_digest.update(data)
+                dst.write(data)
+        os.replace(temp_path, target)
+    except UnicodeDecodeError:
+        return None
+    finally:
+        if temp_path.exists():
+            temp_path.unlink()
+    return source_digest.hexdigest(), output_digest.hexdigest()
+
+
+def _scan_source(source, source_stat):
+    """Index a source file in one mmap-backed read.
+
+    Records its hash, whether its head decodes as UTF-8, whether it has carriage
+    returns (which text-mode copies normalise) and the placeholder names it uses.
+    """
+    info = {
+        'size': source_stat.st_size,
+        'mtime_ns': source_stat.st_mtime_ns,
+        'text': True,
+        'cr': False,
+        'refs': [],
+        'hash': hashlib.sha256(b'').hexdigest(),
+    }
+    if source_stat.st_size == 0:
+        return info
+    with open(source, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        _scan_data(data, info)
+    return info
+
+
+def _scan_data(data, info):
+    """Fill a source index entry from a file's bytes (a bytes object or an mmap)"""
+    info['hash'] = hashlib.sha256(data).hexdigest()
+    try:
+        decoder = codecs.getincrementaldecoder('utf-8')()
+        decoder.decode(data[:SNIFF_BYTES], final=len(data) <= SNIFF_BYTES)
+    except UnicodeDecodeError:
+        info['text'] = False
+    info['cr'] = data.find(b'\r') != -1
+    refs = {match.group(1) for match in PLACEHOLDER_BYTES_PATTERN.finditer(data)}
+    info['refs'] = sorted(ref.decode('utf-8', 'replace') for ref in refs)
+    return info
+
+
+def _scan_stream(stream, info, chunk_size=STREAM_CHUNK_SIZE):
+    """_scan_data for a stream read in chunks (large git blobs), in bounded memory"""
+    digest = hashlib.sha256()
+    refs = set()
+    head = b''
+    tail = b''  # Enough of the previous chunk to hold a placeholder split across the boundary
+    while True:
+        data = stream.read(chunk_size)
+        if not data:
+            break
+        digest.update(data)
+        if len(head) < SNIFF_BYTES + 1:
+            head += data[:SNIFF_BYTES + 1 - len(head)]
+        info['cr'] = info['cr'] or data.find(b'\r') != -1
+        buffer = tail + data
+        refs.update(match.group(1) for match in PLACEHOLDER_BYTES_PATTERN.finditer(buffer))
+        tail = buffer[-(PLACEHOLDER_MAX_BYTES - 1):]
+    info['hash'] = digest.hexdigest()
+    try:
+        decoder = codecs.getincrementaldecoder('utf-8')()
+        decoder.decode(head[:SNIFF_BYTES], final=len(head) <= SNIFF_BYTES)
+    except UnicodeDecodeError:
+        info['text'] = False
+    info['refs'] = sorted(ref.decode('utf-8', 'replace') for ref in refs)
+    return info
+
+
+# One `git cat-file --batch` reader per repo for each worker thread (and process)
+_blob_readers = threading.local()
+_blob_reader_processes = []  # Every reader this process started, for _close_blob_readers
+_blob_reader_lock = threading.Lock()
+_blob_reader_pid = None  # Process the list belongs to (forked workers inherit the parent's)
+
+
+def _start_blob_reader(repo):
+    """Start a cat-file reader and register it to be closed when the run (or worker) ends"""
+    global _blob_reader_pid
+    process = subprocess.Popen(['git', 'cat-file', '--batch'], cwd=repo, stdin=subprocess.PIPE,
+                               stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    with _blob_reader_lock:
+        if _blob_reader_pid != os.getpid():
+            _blob_reader_processes.clear()
+            _blob_reader_pid = os.getpid()
+            import multiprocessing
+            import multiprocessing.util
+            if multiprocessing.parent_process() is None:
+                atexit.register(_close_blob_readers)
+            else:
+                # Pool workers leave through os._exit, which skips atexit but runs these
+                multiprocessing.util.Finalize(None, _close_blob_readers, exitpriority=0)
+        _blob_reader_processes.append(process)
+    return process
+
+
+def _close_blob_readers():
+    """End this process's cat-file readers (EOF on stdin stops them) and reap them"""
+    with _blob_reader_lock:
+        if _blob_reader_pid != os.getpid():
+            return
+        processes = list(_blob_reader_processes)
+        _blob_reader_processes.clear()
+    for process in processes:
+        for pipe in (process.stdin, process.stdout):
+            try:
+                pipe.close()
+            except OSError:
+                pass
+        try:
+            process.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+
+
+class _BlobStream:
+    """Read-only file view of one blob's contents on a cat-file --batch reader"""
+
+    def __init__(self, stdout, oid, repo, size):
+        self.stdout = stdout
+        self.oid = oid
+        self.repo = repo
+        self.remaining = size
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.stdout.read(size) if size else b''
+        if len(data) != size:
+            raise OSError(errno.EIO, f"Short read of git object {self.oid}", self.repo)
+        self.remaining -= size
+        return data
+
+
+@contextmanager
+def _open_blob(blob):
+    """Stream a git blob from the repo's object database through this thread's cat-file reader"""
+    repo, oid, size = blob
+    readers = getattr(_blob_readers, 'readers', None)
+    if readers is None or _blob_readers.pid != os.getpid():
+        readers = _blob_readers.readers = {}
+        _blob_readers.pid = os.getpid()
+    reader = readers.get(repo)
+    if reader is None or reader.poll() is not None:
+        reader = readers[repo] = _start_blob_reader(repo)
+    reader.stdin.write(oid.encode('ascii') + b'\n')
+    reader.stdin.flush()
+    header = reader.stdout.readline().split()
+    if len(header) != 3 or header[1] != b'blob':
+        raise OSError(errno.ENOENT, f"Git object {oid} not found", repo)
+    if int(header[2]) != size:
+        reader.kill()  # Its unread contents would answer the next request
+        raise OSError(errno.EIO, f"Git object {oid} has an unexpected size", repo)
+    stream = _BlobStream(reader.stdout, oid, repo, size)
+    try:
+        yield stream
+    finally:
+        # Readers stopping early (e.g. not UTF-8) must still leave the reader at the next response
+        try:
+            while stream.remaining:
+                stream.read(STREAM_CHUNK_SIZE)
+            reader.stdout.read(1)  # Trailing newline
+        except OSError:
+            reader.kill()  # Out of step: the next read starts a fresh reader
+
+
+def _read_blob(blob):
+    """Contents of a (small) git blob in one read"""
+    with _open_blob(blob) as stream:
+        return stream.read()
+
+
+def _write_blob(blob, target, shared, stream_threshold):
+    """Write a git blob's contents verbatim, in chunks when it is larger than stream_threshold"""
+    with open(target, 'wb') as f:
+        if blob[2] > stream_threshold:
+            with _open_blob(blob) as stream:
+                shutil.copyfileobj(stream, f, STREAM_CHUNK_SIZE)
+        else:
+            f.write(_shared_blob_data(blob, shared))
+
+
+def _shared_blob_data(blob, shared):
+    """A blob's contents, read at most once per task group"""
+    if shared.get('data') is None:
+        shared['data'] = _read_blob(blob)
+    return shared['data']
+
+
+def _blob_stat(blob):
+    """Stat-like key of a git blob: its object id stands in for the mtime"""
+    return SimpleNamespace(st_size=blob[2], st_mtime_ns=blob[1])
+
+
+def _remove_target(target):
+    """Unlink an existing target so writes never go through a hardlink or symlink into a source"""
+    try:
+        os.unlink(target)
+    except FileNotFoundError:
+        pass
+    except IsADirectoryError:
+        shutil.rmtree(target)
+
+
+def _copy_file_range(source, target):
+    """Zero-copy file copy inside the kernel (may reflink or copy server-side)"""
+    with open(source, 'rb') as fsrc, open(target, 'wb') as fdst:
+        size = os.fstat(fsrc.fileno()).st_size
+        offset = 0
+        while offset < size:
+            copied = os.copy_file_range(fsrc.fileno(), fdst.fileno(), size - offset)
+            if copied == 0:
+                break
+            offset += copied
+        if offset < size:
+            raise OSError(errno.EIO, f"Short copy: {offset} of {size} bytes")
+    shutil.copystat(source, target)
+
+
+def _reflink(source, target):
+    """Clone a file copy-on-write, sharing its data blocks with the source"""
+    if sys.platform == 'darwin':
+        import ctypes
+        libc = ctypes.CDLL(None, use_errno=True)
+        if libc.clonefile(os.fsencode(source), os.fsencode(target), 0) != 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error))
+        return
+    if not sys.platform.startswith('linux'):
+        raise OSError(errno.EOPNOTSUPP, 'reflink is not supported on this platform')
+    import fcntl
+    with open(source, 'rb') as fsrc, open(target, 'wb') as fdst:
+        fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+    shutil.copystat(source, target)
+
+
+def _copy_file(source, target):
+    """Copy a file with copy_file_range where available, else shutil.copy2 (sendfile on Linux)"""
+    if hasattr(os, 'copy_file_range'):
+        try:
+            _copy_file_range(source, target)
+            return
+        except OSError:
+            _remove_target(target)
+    shutil.copy2(source, target)
+
+
+def _place_file(source, target, link_mode):
+    """Materialise an untransformed file at target using link_mode.
+
+    Falls back to a plain copy when the filesystem or platform doesn't support
+    the mode (cross-device hardlinks, no reflink support, no symlink privilege).
+    Returns the mode actually used.
+    """
+    if link_mode != 'copy':
+        try:
+            if link_mode == 'hardlink':
+                os.link(source, target)
+            elif link_mode == 'symlink':
+                os.symlink(os.path.relpath(source, target.parent), target)
+            elif link_mode == 'reflink':
+                _reflink(source, target)
+            return link_mode
+        except (OSError, NotImplementedError, AttributeError):
+            _remove_target(target)
+    _copy_file(source, target)
+    return 'copy'
+
+
+def _exchange_paths(first, second):
+    """Atomically swap two existing paths with renameat2(RENAME_EXCHANGE).
+
+    Returns False where the platform or filesystem doesn't support it.
+    """
+    if not sys.platform.startswith('linux'):
+        return False
+    import ctypes
+    libc = ctypes.CDLL(None, use_errno=True)
+    renameat2 = getattr(libc, 'renameat2', None)
+    if renameat2 is None:
+        return False
+    renameat2.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_int, ctypes.c_char_p, ctypes.c_uint]
+    if renameat2(AT_FDCWD, os.fsencode(first), AT_FDCWD, os.fsencode(second), RENAME_EXCHANGE) == 0:
+        return True
+    error = ctypes.get_errno()
+    if error in (errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP):
+        return False
+    raise OSError(error, os.strerror(error), str(second))
+
+
+def _swap_in_directory(staging, target):
+    """Replace target with the fully built staging directory, then delete the old tree.
+
+    The switch is a single rename, so readers see either the old tree or the new
+    one. Without renameat2 the old tree is renamed aside first, leaving target
+    missing for the moment between two renames.
+    """
+    if not os.path.lexists(target):
+        os.rename(staging, target)
+        return
+    if _exchange_paths(staging, target):
+        shutil.rmtree(staging)
+        return
+    retired = target.with_name(f"{target.name}.provision-old")
+    if os.path.lexists(retired):
+        shutil.rmtree(retired)
+    os.rename(target, retired)
+    os.rename(staging, target)
+    shutil.rmtree(retired)
+
+
+class InotifyWatcher:
+    """Changed paths under a set of roots, from Linux inotify through ctypes.
+
+    Directory roots are watched recursively, including directories created later;
+    for a file root only its parent directory is watched, and only events for the
+    file's name are reported. Raises OSError where inotify is unavailable or out of watches.
+    """
+
+    def __init__(self, roots):
+        if not sys.platform.startswith('linux'):
+            raise OSError(errno.ENOSYS, "inotify is only available on Linux")
+        import ctypes
+        self._ctypes = ctypes
+        libc = ctypes.CDLL(None, use_errno=True)
+        self._add_watch = libc.inotify_add_watch
+        self._add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error))
+        self.directories = {}  # Watch descriptor -> directory
+        self.trees = set()  # Watch descriptors of directories under a root, followed into new subdirectories
+        self.names = {}  # Watch descriptor -> file names watched in that directory
+        try:
+            for root in roots:
+                if root.is_dir():
+                    self._watch_tree(root)
+                else:
+                    wd = self._watch(root.parent)
+                    if wd is not None:
+                        self.names.setdefault(wd, set()).add(root.name)
+        except OSError:
+            self.close()
+            raise
+
+    def _watch(self, directory):
+        wd = self._add_watch(self.fd, os.fsencode(directory), WATCH_MASK)
+        if wd < 0:
+            error = self._ctypes.get_errno()
+            if error != errno.ENOENT:  # Removed before it could be watched
+                raise OSError(error, os.strerror(error), str(directory))
+            return None
+        self.directories[wd] = directory
+        return wd
+
+    def _watch_tree(self, root):
+        for dirpath, dirnames, _ in os.walk(root):
+            dirnames[:] = [name for name in dirnames if not _is_pruned_dir(name)]
+            wd = self._watch(Path(dirpath))
+            if wd is not None:
+                self.trees.add(wd)
+
+    def poll(self, timeout):
+        """Paths changed within timeout seconds (None blocks); None if events were lost"""
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return set()
+        try:
+            data = os.read(self.fd, 1 << 16)
+        except BlockingIOError:
+            return set()
+        changed = set()
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = struct.unpack_from('iIII', data, offset)
+            name = data[offset + 16:offset + 16 + length].rstrip(b'\0')
+            offset += 16 + length
+            if mask & IN_Q_OVERFLOW:
+                return None
+            if mask & IN_IGNORED:
+                self.directories.pop(wd, None)
+                self.trees.discard(wd)
+                self.names.pop(wd, None)
+                continue
+            directory = self.directories.get(wd)
+            if directory is None or not name:
+                continue
+            name = os.fsdecode(name)
+            if wd not in self.trees:
+                if name in self.names.get(wd, ()):
+                    changed.add(directory / name)
+                continue
+            path = directory / name
+            changed.add(path)
+            if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO) and not _is_pruned_dir(name):
+                # Files may land in it before the watch exists; the caller walks the directory
+                try:
+                    self._watch_tree(path)
+                except OSError:
+                    # Out of watches (ENOSPC): report lost events so the caller starts over
+                    return None
+        return changed
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+
+class PollingWatcher:
+    """mtime-polling stand-in for InotifyWatcher where inotify is unavailable"""
+
+    def __init__(self, roots, interval=WATCH_POLL_INTERVAL):
+        self.roots = list(roots)
+        self.interval = interval
+        self.state = self._scan()
+
+    def _scan(self):
+        state = {}
+        for root in self.roots:
+            try:
+                files = walk_files(root) if root.is_dir() else [(root, os.stat(root))]
+                for path, entry in files:
+                    stat_result = entry.stat() if isinstance(entry, os.DirEntry) else entry
+                    state[path] = (stat_result.st_size, stat_result.st_mtime_ns)
+            except OSError:
+                continue
+        return state
+
+    def poll(self, timeout):
+        """Paths whose size or mtime changed, appeared or vanished since the last scan"""
+        time.sleep(self.interval if timeout is None else min(timeout, self.interval))
+        state = self._scan()
+        changed = {path for path in state.keys() | self.state.keys() if state.get(path) != self.state.get(path)}
+        self.state = state
+        return changed
+
+    def close(self):
+        pass
+
+
+def _collect_changes(watcher, debounce):
+    """Wait for a change, then keep collecting until debounce seconds pass quietly (None: rescan)"""
+    changed = set()
+    while not changed:
+        changed = watcher.poll(None)
+        if changed is None:
+            return None
+    while True:
+        more = watcher.poll(debounce)
+        if more is None:
+            return None
+        if not more:
+            return changed
+        changed |= more
+
+
+def _run_git(args, cwd=None):
+    """Run a git command, raising CalledProcessError (with stderr) on a non-zero exit"""
+    return subprocess.run(['git'] + args, cwd=cwd, capture_output=True, text=True, check=True)
+
+
+def _git_remote_url(url):
+    """Clone URL for git; local paths become file:// URLs so shallow and partial clones apply"""
+    if '://' not in url and os.path.isdir(url):
+        return Path(url).resolve().as_uri()
+    return url
+
+
+def _is_git_cache(cache_path, bare=False):
+    """Whether cache_path is a repo of the expected layout (bare, or with a working tree)"""
+    if bare:
+        return (cache_path / 'HEAD').is_file() and (cache_path / 'objects').is_dir()
+    return (cache_path / '.git').exists()
+
+
+def _git_has_commit(cache_path, commit, bare=False):
+    """Whether a local repo already holds commit (no network access)"""
+    if not commit or not _is_git_cache(cache_path, bare):
+        return False
+    try:
+        _run_git(['rev-parse', '--quiet', '--verify', f"{commit}^{{commit}}"], cwd=cache_path)
+    except subprocess.CalledProcessError:
+        return False
+    return True
+
+
+def _git_ls_tree(cache_path, paths, revision='HEAD'):
+    """Blobs under paths at revision: yields (path, oid, size) without touching a working tree"""
+    output = _run_git(['ls-tree', '-r', '-l', '-z', '--full-tree', revision, '--']
+                      + [path.strip('/') for path in paths if path.strip('/')], cwd=cache_path).stdout
+    for record in output.split('\0'):
+        if not record:
+            continue
+        meta, path = record.split('\t', 1)
+        mode, object_type, oid, size = meta.split()
+        # Symlinks and submodules have no file content to provision
+        if object_type == 'blob' and mode != '120000':
+            yield path, oid, int(size)
+
+
+def _prefetch_git_blobs(cache_path, paths):
+    """Fetch the blobs under paths that a blob-less partial clone lacks, in one request"""
+    try:
+        promisor = _run_git(['config', '--get', 'remote.origin.promisor'], cwd=cache_path).stdout.strip()
+    except subprocess.CalledProcessError:
+        return
+    if promisor != 'true':
+        return
+    wanted = {oid for _, oid, _ in _git_ls_tree(cache_path, paths)}
+    present = set(_run_git(['cat-file', '--batch-all-objects', '--batch-check=%(objectname)'],
+                           cwd=cache_path).stdout.split())
+    missing = sorted(wanted - present)
+    if missing:
+        subprocess.run(['git', '-c', 'fetch.negotiationAlgorithm=noop', 'fetch', '--quiet', '--no-tags',
+                        '--no-write-fetch-head', '--recurse-submodules=no', '--filter=blob:none', '--stdin',
+                        'origin'], cwd=cache_path, input='\n'.join(missing) + '\n', capture_output=True,
+                       text=True, check=True)
+
+
+def _sync_git_repo(url, branch, cache_path, sparse_paths, pin=None, bare=False):
+    """Shallow, partial clone or update of one branch, limited to sparse_paths.
+
+    With a pinned commit the cache is moved to exactly that commit, without any
+    network access when the cache already holds it. A working-tree cache checks
+    out only sparse_paths (the whole tree when there are none). A bare cache has
+    no checkout at all: HEAD is detached at the commit and the blobs under
+    sparse_paths are fetched in bulk for reading straight from the object
+    database. Returns (action, commit, tree) where action is 'cloned',
+    'updated' or 'pinned'; git failures raise CalledProcessError.
+    """
+    patterns = sorted({'/' + path.strip('/') for path in sparse_paths if path.strip('/')})
+    if _git_has_commit(cache_path, pin, bare):
+        action = 'pinned'
+        revision = pin
+    else:
+        if not _is_git_cache(cache_path, bare):
+            # Missing, or left in the other layout by an earlier version
+            if cache_path.exists():
+                shutil.rmtree(cache_path)
+            cache_path.parent.mkdir(parents=True, exist_ok=True)
+            layout_args = ['--bare'] if bare else ['--no-checkout']
+            branch_args = ['--branch', branch] if branch else []
+            _run_git(['clone', '--quiet', '--depth', '1', '--filter=blob:none'] + layout_args + branch_args
+                     + [_git_remote_url(url), str(cache_path)])
+            action = 'cloned'
+            revision = 'HEAD'
+        else:
+            action = 'updated'
+            revision = 'FETCH_HEAD'
+        if pin:
+            _run_git(['fetch', '--quiet', '--depth', '1', 'origin', pin], cwd=cache_path)
+            revision = pin
+        elif action == 'updated':
+            _run_git(['fetch', '--quiet', '--depth', '1', 'origin', branch or 'HEAD'], cwd=cache_path)
+    if bare:
+        commit = _run_git(['rev-parse', f"{revision}^{{commit}}"], cwd=cache_path).stdout.strip()
+        _run_git(['update-ref', '--no-deref', 'HEAD', commit], cwd=cache_path)
+        if patterns:
+            _prefetch_git_blobs(cache_path, patterns)
+    else:
+        if patterns:
+            _run_git(['sparse-checkout', 'set', '--no-cone'] + patterns, cwd=cache_path)
+        else:
+            _run_git(['sparse-checkout', 'disable'], cwd=cache_path)
+        _run_git(['reset', '--quiet', '--hard', revision], cwd=cache_path)
+    commit, tree = _run_git(['rev-parse', 'HEAD', 'HEAD^{tree}'], cwd=cache_path).stdout.split()
+    return action, commit, tree
+
+
+def _target_matches(target, previous):
+    """Check that a provisioned file still holds the output recorded in the manifest"""
+    try:
+        target_stat = os.stat(target)
+    except OSError:
+        return False
+    if _stat_key(target_stat) == previous.get('output_stat'):
+        return True
+    if target_stat.st_size != previous.get('output_stat', [None])[0]:
+        return False
+    return _hash_file(target) == previous.get('output_hash')
+
+
+def _target_placed_as(target, link_mode, previous=None):
+    """Whether a target was placed the way link_mode places files.
+
+    A run in another link mode than the manifest entry records replaces the
+    file, and a copy must not be a symlink or a hardlink shared with its source.
+    """
+    if previous is not None and previous.get('link_mode', 'copy') != link_mode:
+        return False
+    if link_mode != 'copy':
+        return True
+    target_stat = os.lstat(target)
+    return S_ISREG(target_stat.st_mode) and target_stat.st_nlink == 1
+
+
+def _target_removable(target, entry):
+    """Whether a provisioned file may be removed as provisioning's own output.
+
+    True when it still holds the recorded output, or when it is a link placed by
+    --link-mode symlink that dangles because its source was deleted.
+    """
+    if entry.get('link_mode') == 'symlink' and os.path.islink(target) and not os.path.exists(target):
+        return True
+    return _target_matches(target, entry)
+
+
+def _inspect_file_task(task, shared=None):
+    """Stat and index a task's source and compare it with the target's manifest entry.
+
+    Returns (source_stat, info, used, unknown, vars_hash, unchanged) and never writes;
+    shared by the copy worker and dry-run predictions. Git blob contents read
+    for indexing are kept in ``shared['data']`` for the writer, unless the blob is
+    over the stream threshold: those are scanned in chunks and streamed again to write.
+    """
+    source = task['source']
+    blob = task.get('blob')
+    source_stat = _blob_stat(blob) if blob else os.stat(source)
+    info = task['index_entry']
+    if not info or [info['size'], info['mtime_ns']] != _stat_key(source_stat):
+        if blob:
+            info = {'size': source_stat.st_size, 'mtime_ns': source_stat.st_mtime_ns,
+                    'text': True, 'cr': False, 'refs': []}
+            if source_stat.st_size > task['stream_threshold']:
+                with _open_blob(blob) as stream:
+                    info = _scan_stream(stream, info)
+            else:
+                data = _read_blob(blob)
+                if shared is not None:
+                    shared['data'] = data
+                info = _scan_data(data, info)
+        else:
+            info = _scan_source(source, source_stat)
+    used, unknown = task['substituter'].references(info['refs'])
+    # Only the variables a file references affect its output
+    vars_hash = hash_variables(used) if info['refs'] else None
+
+    unchanged = False
+    previous = task.get('previous')
+    if previous and previous.get('source') == task['source_key']:
+        inputs_match = previous.get('transform') == 'copy' or previous.get('vars_hash') == vars_hash
+        unchanged = (info['hash'] == previous.get('source_hash') and inputs_match
+                     and _target_matches(task['target'], previous)
+                     and _target_placed_as(task['target'], task['link_mode'], previous))
+    return source_stat, info, used, unknown, vars_hash, unchanged
+
+
+def _classify_task(task, info):
+    """Whether a task's source is substituted as text"""
+    if task['text'] is not None:
+        return task['text']
+    return _is_text_path(task['source'], task['text_extensions'], task['binary_extensions'], info['text'])
+
+
+def _provision_file_group(tasks):
+    """Provision tasks that share a source, variable set and classification.
+
+    The source is scanned once and, when it needs substitution, rendered once;
+    the other targets receive a copy of the first rendered output.
+    """
+    shared = {}
+    return [_provision_file_task(task, shared) for task in tasks]
+
+
+def _provision_file_task(task, shared=None):
+    """Classify, substitute and write a single file.
+
+    Runs inside the worker pool, so it only touches its own target and reports
+    failures in the returned result instead of raising. Module level so it can
+    be pickled for the process executor. The source index entry tells whether
+    the file is text and which placeholders it uses; files that resolve none are
+    placed with the fast copy/link path without being decoded. When the task
+    carries the previous manifest entry for its target, unchanged files are
+    skipped without writing. Target directories are created by the caller.
+    ``shared`` carries the scan and rendered output between tasks of one group.
+    """
+    started = time.perf_counter_ns() if task.get('profile') else None
+    inspected = None
+    shared = {} if shared is None else shared
+    if shared.get('info') is not None:
+        task = dict(task, index_entry=shared['info'])
+    source = task['source']
+    target = task['target']
+    result = {
+        'source': source, 'target': target, 'origin': task['origin'], 'action': None,
+        'error': None, 'entry': None, 'unknown': [], 'method': None, 'index': None,
+        'tool': task.get('tool'),
+    }
+    try:
+        source_stat, info, used, unknown, vars_hash, unchanged = _inspect_file_task(task, shared)
+        if started is not None:
+            inspected = time.perf_counter_ns()
+        if info is not task['index_entry']:
+            result['index'] = info
+        shared['info'] = info
+        source_hash = info['hash']
+        if unchanged:
+            result['action'] = 'unchanged'
+            result['entry'] = dict(task['previous'], source_stat=_stat_key(source_stat),
+                                   output_stat=_stat_key(os.stat(target)))
+            return result
+
+        is_text = _classify_task(task, info)
+        _remove_target(target)
+        link_mode = task['link_mode']
+        blob = task['blob']
+        rendered = None
+        # Text needs rewriting only to resolve variables or normalise line endings
+        if is_text and (used or info['cr']) and shared.get('rendered') is not False:
+            if shared.get('rendered'):
+                # Another target already holds this exact output: copy it instead of re-rendering
+                rendered_target, output_hash, render_unknown = shared['rendered']
+                _copy_file(rendered_target, target)
+                rendered = (source_hash, output_hash)
+            else:
+                render_unknown = set()
+                if source_stat.st_size > task['stream_threshold']:
+                    rendered = _render_text_streaming(source, target, task['substituter'], render_unknown,
+                                                      blob=blob)
+                elif blob:
+                    rendered = _render_text(source, target, task['substituter'], render_unknown,
+                                            _shared_blob_data(blob, shared))
+                else:
+                    rendered = _render_text(source, target, task['substituter'], render_unknown)
+                shared['rendered'] = (target, rendered[1], render_unknown) if rendered is not None else False
+            # None means the file isn't UTF-8 after all: fall through and copy it as binary
+            if rendered is not None:
+                result['action'] = 'processed'
+                result['unknown'] = sorted(render_unknown)
+                output_hash = rendered[1]
+        if rendered is None and blob:
+            # Git objects have no file to link to
+            _write_blob(blob, target, shared, task['stream_threshold'])
+            result['method'] = 'copy'
+            result['action'] = 'copied'
+            output_hash = source_hash
+            if is_text:
+                result['unknown'] = unknown
+        elif rendered is None:
+            result['method'] = _place_file(source, target, link_mode)
+            result['action'] = 'copied'
+            output_hash = source_hash
+            if is_text:
+                result['unknown'] = unknown
+
+        if task['track']:
+            # Files with placeholders depend on the variables even when none resolved
+            transform = 'substitute' if is_text and info['refs'] else 'copy'
+            result['entry'] = {
+                'source': task['source_key'],
+                'source_hash': source_hash,
+                'source_stat': _stat_key(source_stat),
+                'vars_hash': vars_hash if transform == 'substitute' else None,
+                'transform': transform,
+                'link_mode': link_mode,
+                'output_hash': output_hash,
+                'output_stat': _stat_key(os.stat(target)),
+            }
+    except OSError as e:
+        result['action'] = 'failed'
+        result['error'] = str(e)
+    finally:
+        if started is not None:
+            result['timing'] = (started, inspected, time.perf_counter_ns(), os.getpid(), threading.get_native_id())
+    return result
+
+
+def _clean_file_task(task):
+    """Remove one provisioned file if it still holds its recorded output.
+
+    task is (target, manifest entry); runs on the worker pool.
+    """
+    target, entry = task
+    result = {'target': target, 'action': None, 'error': None}
+    try:
+        if not os.path.lexists(target):
+            result['action'] = 'missing'
+        elif _target_removable(target, entry):
+            os.unlink(target)
+            result['action'] = 'removed'
+        else:
+            result['action'] = 'modified'
+    except OSError as e:
+        result['action'] = 'failed'
+        result['error'] = str(e)
+    return result
+
+
+def _rendered_hash(task, shared):
+    """Hash of a text task's substituted output, streamed when large; None if not UTF-8"""
+    digest = hashlib.sha256()
+    blob = task['blob']
+    try:
+        if blob and blob[2] <= task['stream_threshold']:
+            digest.update(_encode_text(task['substituter'].substitute(
+                _decode_text(_shared_blob_data(blob, shared)))))
+        else:
+            with (_open_blob(blob) if blob else open(task['source'], 'rb')) as f:
+                # Chunked, so large files are hashed in bounded memory
+                for text in task['substituter'].substitute_chunks(_iter_text_chunks(f, hashlib.sha256())):
+                    digest.update(_encode_text(text))
+    except UnicodeDecodeError:
+        return None
+    return digest.hexdigest()
+
+
+def _predict_file_task(task):
+    """Predict whether running a task would add, change or leave its target unchanged"""
+    result = {'source': task['source'], 'target': task['target'], 'state': None, 'size': 0, 'error': None}
+    shared = {}
+    try:
+        source_stat, info, used, unknown, vars_hash, unchanged = _inspect_file_task(task, shared)
+        result['size'] = source_stat.st_size
+        if unchanged:
+            result['state'] = 'unchanged'
+        elif not os.path.lexists(task['target']):
+            result['state'] = 'new'
+        elif not os.path.exists(task['target']):
+            result['state'] = 'changed'  # Dangling link
+        elif not _target_placed_as(task['target'], task['link_mode'], task['previous']):
+            result['state'] = 'changed'  # Replaced to switch link modes
+        else:
+            # Without a manifest entry, compare the output a run would write with the target
+            expected = None
+            if _classify_task(task, info) and (used or info['cr']):
+                expected = _rendered_hash(task, shared)
+            if expected is None:
+                expected = info['hash']  # Placed verbatim (also files that turn out not to be UTF-8)
+            result['state'] = 'unchanged' if _hash_file(task['target']) == expected else 'changed'
+    except OSError as e:
+        result['state'] = 'failed'
+        result['error'] = str(e)
+    return result
+
+
+def format_bytes(size):
+    """Human-readable byte count"""
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if size < 1024 or unit == 'GB':
+            return f"{size:.0f} {unit}" if unit == 'B' else f"{size:.1f} {unit}"
+        size /= 1024
+
+
+class ConsoleReporter:
+    """Render provisioning events as console lines.
+
+    verbose prints a line per file as provision.py always did; quiet keeps
+    only warnings and errors.
+    """
+
+    def __init__(self, verbose=True, quiet=False, stream=None):
+        self.verbose = verbose
+        self.quiet = quiet
+        self.stream = stream
+
+    def __call__(self, event):
+        event_type = event['type']
+        if event_type == 'message':
+            if self.quiet and event['level'] == 'info':
+                return
+            self.write(event['text'])
+        elif event_type == 'file_failed':
+            self.write(f"  Error: Failed {event['source']} -> {event['target']}: {event['error']}")
+        elif self.verbose and not self.quiet:
+            if event_type == 'file_copied':
+                self.write(f"  {event['label']} {event['source']} -> {event['target']}")
+            elif event_type == 'file_removed':
+                self.write(f"  Removed {'stale file ' if event['reason'] == 'stale' else ''}{event['target']}")
+            elif event_type == 'file_skipped' and event['reason'] == 'existing':
+                self.write(f"  Skipping existing file: {event['target']}")
+
+    def write(self, text):
+        print(text, file=self.stream or sys.stdout)
+
+    def close(self):
+        pass
+
+
+class ProgressReporter(ConsoleReporter):
+    """Compact progress bar for file work, with messages printed above it"""
+
+    FILE_EVENTS = ('file_copied', 'file_skipped', 'file_failed')
+
+    def __init__(self, stream=None, width=30, interval=0.1):
+        super().__init__(verbose=False)
+        self.bar_stream = stream or sys.stderr
+        self.width = width
+        self.interval = interval
+        self.total = 0
+        self.done = 0
+        self.label = ''
+        self._last_draw = 0.0
+        self._drawn = False
+
+    def __call__(self, event):
+        event_type = event['type']
+        if event_type == 'phase_start' and event.get('total') is not None:
+            self.total = event['total']
+            self.done = 0
+            self.label = event.get('name', '')
+            self.draw(force=True)
+        elif event_type in self.FILE_EVENTS:
+            if event_type == 'file_skipped' and event['reason'] == 'existing':
+                return
+            self.done += 1
+            if event_type == 'file_failed':
+                super().__call__(event)
+            self.draw(force=self.done == self.total)
+        elif event_type == 'phase_end' and event.get('total') is not None:
+            self.draw(force=True)
+            self.clear(newline=True)
+            self.total = 0
+        else:
+            super().__call__(event)
+
+    def draw(self, force=False):
+        now = time.monotonic()
+        if not self.total or (not force and now - self._last_draw < self.interval):
+            return
+        self._last_draw = now
+        filled = int(self.width * min(self.done, self.total) / self.total)
+        bar = '#' * filled + '.' * (self.width - filled)
+        self.bar_stream.write(f"\r  {self.label} [{bar}] {self.done}/{self.total} files")
+        self.bar_stream.flush()
+        self._drawn = True
+
+    def clear(self, newline=False):
+        if self._drawn:
+            self.bar_stream.write('\n' if newline else '\r\033[K')
+            self.bar_stream.flush()
+            self._drawn = False
+
+    def write(self, text):
+        self.clear()
+        super().write(text)
+        self.draw(force=True)
+
+
+class JsonSummaryReporter:
+    """Collect events silently and print one JSON summary when closed"""
+
+    def __init__(self, stream=None):
+        self.stream = stream
+        self.files = {}
+        self.failures = []
+        self.messages = {'warning': [], 'error': []}
+        self.phases = []
+
+    def __call__(self, event):
+        event_type = event['type']
+        if event_type == 'message':
+            if event['level'] in self.messages:
+                self.messages[event['level']].append(event['text'].strip())
+        elif event_type == 'phase_end':
+            self.phases.append({key: event[key] for key in ('phase', 'name', 'duration') if key in event})
+        elif event_type.startswith('file_'):
+            key = event_type[len('file_'):]
+            if event_type == 'file_copied':
+                key = event['action']
+            elif event_type == 'file_skipped':
+                key = f"skipped_{event['reason']}"
+            self.files[key] = self.files.get(key, 0) + 1
+            if event_type == 'file_failed':
+                self.failures.append({'source': str(event['source']), 'target': str(event['target']),
+                                      'error': event['error']})
+
+    def summary(self):
+        return {
+            'files': self.files,
+            'failures': self.failures,
+            'warnings': self.messages['warning'],
+            'errors': self.messages['error'],
+            'phases': self.phases,
+        }
+
+    def close(self):
+        print(json.dumps(self.summary(), indent=2, sort_keys=True), file=self.stream or sys.stdout)
+
+
+class Profiler:
+    """Nested timing spans and per-file counters of a run.
+
+    Spans are written as a Chrome trace (chrome://tracing, ui.perfetto.dev) and summed
+    into a tree for the console. Times are perf_counter_ns, which is system-wide on
+    Linux, so spans measured in process workers line up with the main process.
+    python adds a cProfile capture of the main thread, memory a tracemalloc one.
+    """
+
+    def __init__(self, python=False, memory=False):
+        self.origin = time.perf_counter_ns()
+        self.events = []  # Chrome trace events
+        self.totals = {}  # Span path -> [count, nanoseconds], in first-seen order
+        self.counters = {}  # Per-file counters: actions, inspect and write nanoseconds
+        self.threads = {}  # (pid, tid) -> lane name
+        self._stack = []
+        self._main = (os.getpid(), threading.get_native_id())
+        self.threads[self._main] = 'main'
+        self.cprofile = None
+        self.memory = memory
+        if memory:
+            import tracemalloc
+            tracemalloc.start()
+        if python:
+            import cProfile
+            self.cprofile = cProfile.Profile()
+            self.cprofile.enable()
+
+    def add_span(self, name, category, start, end, lane=None, **args):
+        """Record a complete span measured on any thread or worker process"""
+        pid, tid = lane or (os.getpid(), threading.get_native_id())
+        self.threads.setdefault((pid, tid), f"worker {tid}")
+        self.events.append({'name': name, 'cat': category, 'ph': 'X', 'pid': pid, 'tid': tid,
+                            'ts': (start - self.origin) / 1000, 'dur': (end - start) / 1000,
+                            'args': {key: str(value) for key, value in args.items()}})
+
+    @contextmanager
+    def span(self, name, category='phase', **args):
+        """Time a block of the main thread as a span nested in the open ones"""
+        self._stack.append(name)
+        total = self.totals.setdefault(tuple(self._stack), [0, 0])
+        start = time.perf_counter_ns()
+        try:
+            yield
+        finally:
+            end = time.perf_counter_ns()
+            self._stack.pop()
+            self.add_span(name, category, start, end, lane=self._main, **args)
+            total[0] += 1
+            total[1] += end - start
+            if self.memory:
+                import tracemalloc
+                self.events.append({'name': 'memory', 'ph': 'C', 'pid': self._main[0], 'tid': self._main[1],
+                                    'ts': (end - self.origin) / 1000,
+                                    'args': {'traced_bytes': tracemalloc.get_traced_memory()[0]}})
+
+    def traced(self, function, name, category, **args):
+        """Wrap a function submitted to a pool so each call is recorded as a span"""
+        def run(*call_args):
+            start = time.perf_counter_ns()
+            try:
+                return function(*call_args)
+            finally:
+                self.add_span(name, category, start, time.perf_counter_ns(), **args)
+        return run
+
+    def file_result(self, result):
+        """Count a worker result and record its inspect/write timing spans"""
+        action = result['action']
+        self.counters[f"files_{action}"] = self.counters.get(f"files_{action}", 0) + 1
+        timing = result.get('timing')
+        if timing is None:
+            return
+        start, inspected, end, pid, tid = timing
+        target = result['target'].name
+        if inspected is not None:
+            self.add_span('inspect', 'scan', start, inspected, lane=(pid, tid), file=target)
+            self.counters['inspect_ns'] = self.counters.get('inspect_ns', 0) + inspected - start
+            start = inspected
+        self.add_span(action, 'write', start, end, lane=(pid, tid), file=target)
+        self.counters['write_ns'] = self.counters.get('write_ns', 0) + end - start
+
+    def finish(self, trace_path):
+        """Stop the captures, write the trace (plus a .prof next to it) and return the summary lines"""
+        elapsed = time.perf_counter_ns() - self.origin
+        lines = [f"Profile: {elapsed / 1e9:.3f} s total"]
+        for path, (count, duration) in self.totals.items():
+            label = '  ' * len(path) + path[-1]
+            lines.append(f"{label:<48} {duration / 1e9:8.3f} s {100 * duration / max(elapsed, 1):5.1f}%"
+                         + (f"  x{count}" if count > 1 else ""))
+        files = {key[len('files_'):]: count for key, count in sorted(self.counters.items())
+                 if key.startswith('files_')}
+        if files:
+            lines.append("  Files: " + ', '.join(f"{count} {action}" for action, count in files.items()))
+            lines.append(f"  Worker time: inspect (stat, index, text detection) "
+                         f"{self.counters.get('inspect_ns', 0) / 1e9:.3f} s, "
+                         f"write (substitute, copy, link) {self.counters.get('write_ns', 0) / 1e9:.3f} s")
+        
+        trace_path = Path(trace_path)
+        if self.memory:
+            import tracemalloc
+            current, peak = tracemalloc.get_traced_memory()
+            top = tracemalloc.take_snapshot().statistics('lineno')[:10]
+            tracemalloc.stop()
+            lines.append(f"  Python memory: {format_bytes(current)} held, {format_bytes(peak)} peak; "
+                         f"largest allocation sites:")
+            lines.extend(f"    {format_bytes(stat.size):>9}  {stat.traceback}" for stat in top)
+        
+        if self.cprofile is not None:
+            import io
+            import pstats
+            self.cprofile.disable()
+            profile_path = trace_path.with_suffix('.prof')
+            self.cprofile.dump_stats(profile_path)
+            stream = io.StringIO()
+            pstats.Stats(self.cprofile, stream=stream).sort_stats('cumulative').print_stats(15)
+            output = stream.getvalue()
+            lines.append(f"  cProfile of the main thread saved to {profile_path} (top 15 by cumulative time):")
+            lines.extend('    ' + line for line in output[output.find('ncalls'):].rstrip().splitlines())
+        
+        metadata = [{'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': tid, 'args': {'name': name}}
+                    for (pid, tid), name in self.threads.items()]
+        with open(trace_path, 'w', encoding='utf-8') as f:
+            json.dump({'traceEvents': metadata + self.events, 'displayTimeUnit': 'ms',
+                       'otherData': {'counters': self.counters}}, f)
+        lines.append(f"  Trace written to {trace_path} (open in chrome://tracing or ui.perfetto.dev)")
+        return lines
+
+
+class PathTrie:
+    """Owners of file paths, one node per path component, so a lookup costs O(depth).
+
+    Besides two owners of the same path, insert() reports structural collisions:
+    a file where another owner needs a directory, or the reverse.
+    """
 
-class TemplateProvisioner:
     def __init__(self):
+        self.root = {}  # Component -> child node; the key None holds a file's owner
+
+    def get(self, parts):
+        """Owner of a file path, or None"""
+        node = self.root
+        for part in parts:
+            node = node.get(part)
+            if node is None:
+                return None
+        return node.get(None)
+
+    def insert(self, parts, owner, replace=False):
+        """Record owner for a file path.
+
+        Returns (other owner, kind) on a collision, kind being 'file' (same path),
+        'parent' (an ancestor is a file) or 'directory' (the path holds other files);
+        (None, None) otherwise. replace overwrites the owner of a same-path collision.
+        """
+        node = self.root
+        for depth, part in enumerate(parts):
+            child = node.get(part)
+            if child is None:
+                for rest in parts[depth:]:
+                    node = node.setdefault(rest, {})
+                node[None] = owner
+                return None, None
+            if None in child and depth < len(parts) - 1:
+                return child[None], 'parent'
+            node = child
+        if None in node:
+            other = node[None]
+            if replace:
+                node[None] = owner
+            return other, 'file'
+        stack = [node]
+        while stack:
+            current = stack.pop()
+            if None in current:
+                return current[None], 'directory'
+            stack.extend(current.values())
+        node[None] = owner
+        return None, None
+
+
+class BackupStore:
+    """Compressed, content-addressed snapshots of the files provision update replaced.
+
+    objects/<hash[:2]>/<hash[2:]> holds each distinct file content once, zlib-compressed;
+    snapshots/<id>.json maps the paths a run touched to their previous content hash.
+    """
+
+    def __init__(self, root):
+        self.root = Path(root)
+        self.objects_dir = self.root / 'objects'
+        self.snapshots_dir = self.root / 'snapshots'
+
+    def begin(self, reason, **details):
+        """A new, empty snapshot; nothing is written until it holds files and is saved"""
+        created = datetime.now()
+        return {'version': BACKUP_VERSION, 'id': created.strftime('%Y%m%d-%H%M%S'), 'reason': reason,
+                'created': created.isoformat(timespec='seconds'), 'files': {}, **details}
+
+    def add(self, snapshot, relative, path, digest=None):
+        """Store path's current content (once per distinct hash) under relative in snapshot"""
+        data = Path(path).read_bytes()
+        digest = digest or hashlib.sha256(data).hexdigest()
+        object_path = self._object_path(digest)
+        if not object_path.exists():
+            object_path.parent.mkdir(parents=True, exist_ok=True)
+            temp_path = object_path.with_name(f"{object_path.name}.tmp.{os.getpid()}")
+            with open(temp_path, 'wb') as f:
+                f.write(zlib.compress(data, BACKUP_COMPRESSION_LEVEL))
+            os.replace(temp_path, object_path)
+        snapshot['files'][str(relative)] = {'hash': digest, 'size': len(data),
+                                            'mode': os.stat(path).st_mode & 0o7777}
+
+    def save(self, snapshot):
+        """Write a snapshot that holds files; returns its id, or None if it was empty"""
+        if not snapshot['files']:
+            return None
+        self.snapshots_dir.mkdir(parents=True, exist_ok=True)
+        base_id = snapshot['id']
+        suffix = 1
+        while (self.snapshots_dir / f"{snapshot['id']}.json").exists():
+            suffix += 1
+            snapshot['id'] = f"{base_id}-{suffix}"
+        snapshot_path = self.snapshots_dir / f"{snapshot['id']}.json"
+        temp_path = snapshot_path.with_name(f"{snapshot_path.name}.tmp")
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            f.write(json.dumps(snapshot, indent=2, sort_keys=True) + '\n')
+        os.replace(temp_path, snapshot_path)
+        return snapshot['id']
+
+    def snapshots(self):
+        """Every saved snapshot, oldest first"""
+        snapshots = []
+        if self.snapshots_dir.is_dir():
+            for snapshot_path in sorted(self.snapshots_dir.glob('*.json')):
+                try:
+                    with open(snapshot_path, 'r', encoding='utf-8') as f:
+                        snapshot = json.load(f)
+                except (OSError, ValueError):
+                    continue
+                if isinstance(snapshot, dict) and snapshot.get('version') == BACKUP_VERSION:
+                    snapshots.append(snapshot)
+        return sorted(snapshots, key=lambda snapshot: (snapshot['created'], snapshot['id']))
+
+    def load(self, snapshot_id):
+        """A saved snapshot by id ('latest' for the newest one)"""
+        snapshots = self.snapshots()
+        if snapshot_id == 'latest' and snapshots:
+            return snapshots[-1]
+        for snapshot in snapshots:
+            if snapshot['id'] == snapshot_id:
+                return snapshot
+        raise ValueError(f"Unknown backup snapshot: {snapshot_id}")
+
+    def read(self, digest):
+        """Decompressed content of a stored object"""
+        with open(self._object_path(digest), 'rb') as f:
+            return zlib.decompress(f.read())
+
+    def stored_size(self):
+        """Bytes the object store takes on disk"""
+        if not self.objects_dir.is_dir():
+            return 0
+        return sum(entry.stat().st_size for subdir in os.scandir(self.objects_dir) if subdir.is_dir()
+                   for entry in os.scandir(subdir.path) if entry.is_file())
+
+    def prune(self, keep=None, max_age_days=None):
+        """Drop snapshots beyond the newest keep or older than max_age_days, then unreferenced objects.
+
+        Returns (removed snapshot ids, removed object count, freed bytes).
+        """
+        snapshots = self.snapshots()
+        removed = []
+        cutoff = datetime.now().timestamp() - max_age_days * 86400 if max_age_days is not None else None
+        for position, snapshot in enumerate(snapshots):
+            too_many = keep is not None and position < len(snapshots) - keep
+            too_old = cutoff is not None and datetime.fromisoformat(snapshot['created']).timestamp() < cutoff
+            if too_many or too_old:
+                (self.snapshots_dir / f"{snapshot['id']}.json").unlink()
+                removed.append(snapshot['id'])
+        referenced = {entry['hash'] for snapshot in snapshots if snapshot['id'] not in removed
+                      for entry in snapshot['files'].values()}
+        objects = freed = 0
+        if self.objects_dir.is_dir():
+            for subdir in os.scandir(self.objects_dir):
+                if not subdir.is_dir():
+                    continue
+                for entry in os.scandir(subdir.path):
+                    if subdir.name + entry.name not in referenced:
+                        freed += entry.stat().st_size
+                        os.unlink(entry.path)
+                        objects += 1
+        return removed, objects, freed
+
+    def _object_path(self, digest):
+        return self.objects_dir / digest[:2] / digest[2:]
+
+
+class TemplateProvisioner:
+    def __init__(self, jobs=None, executor='thread', link_mode='copy', reporter=None, target_root=None):
         self.base_dir = Path(__file__).parent
+        # Root that AI tool and project type targets are provisioned into; sources stay in base_dir
+        self.target_root = Path(target_root).resolve() if target_root else self.base_dir
         self.templates_dir = self.base_dir / "templates"
         self.common_dir = self.base_dir / "common"
         self.external_resources_map = self.base_dir / "external-resources.map.yaml"
         self.provision_map = self.base_dir / "provision.map.yaml"
-        self.active_ai_tools = set()  # Track currently provisioned AI tools
+        self.provision_config = None  # Parsed provision.map.yaml, when preloaded (e.g. by fleet workers)
+        self.fetch_git_repos = True  # Clone/pull git repos while planning (fleet workers use pre-fetched caches)
+        self.persist_source_index = True  # Fleet workers hand index updates back instead of writing them
+        self.write_caches = True  # Off for dry runs, which must not write anything (config cache included)
+
+        if executor not in EXECUTOR_TYPES:
+            raise ValueError(f"Unknown executor type: {executor} (expected one of {', '.join(EXECUTOR_TYPES)})")
+        if link_mode not in LINK_MODES:
+            raise ValueError(f"Unknown link mode: {link_mode} (expected one of {', '.join(LINK_MODES)})")
+        self.jobs = max(1, jobs) if jobs else default_job_count()
+        self.executor = executor
+        self.link_mode = link_mode  # How files needing no substitution are materialised
+        self.link_fallbacks = 0  # Files copied because link_mode wasn't supported for them
+        # Callable receiving every provisioning event; defaults to the classic per-file console output
+        self.reporter = reporter if reporter is not None else ConsoleReporter()
+        self.failed_files = []  # Per-file errors reported by the worker pool
+        self.failed_git_repos = []  # Git repos whose clone or update failed
+        self._pool = None
+        self._manifests = []  # Manifests of the AI tools currently being provisioned
+        self._staging = {}  # Cleaned directory -> staging directory it is being rebuilt in
+        self._git_pool = None
+        self._git_fetches = {}  # (lock section, repo key) -> (cache path, pending sync or None, url, branch)
+        self._lock = None  # provision.lock, loaded on first use
+        self.update_lock = False  # Ignore provision.lock pins and move them to the branch heads
+        self._substituters = {}  # Compiled substituters, one per distinct variable set
+        self._renamers = {}  # Compiled file_transforms, one per distinct transform list
+        self._source_index = None  # Per-source text/placeholder index, loaded on first use
+        self._stat_cache = None  # Hashes of files update compares, see get_stat_cache
+        self._source_index_dirty = False
+        self.unknown_placeholders = {}  # Placeholder name -> number of files that left it unresolved
+        self.profiler = None  # Profiler recording spans and per-file timings (--profile)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """Shut down the file-copy and git worker pools and the git blob readers they started"""
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+        if self._git_pool is not None:
+            self._git_pool.shutdown()
+            self._git_pool = None
+        _close_blob_readers()
+
+    def _emit(self, event_type, **fields):
+        """Send a structured event to the reporter"""
+        fields['type'] = event_type
+        self.reporter(fields)
+
+    def _say(self, text, level='info'):
+        """Emit a console message (level is 'info', 'warning' or 'error')"""
+        self._emit('message', level=level, text=text)
+
+    @contextmanager
+    def _phase(self, phase, **fields):
+        """Emit phase_start/phase_end events around a block, with its duration in seconds"""
+        self._emit('phase_start', phase=phase, **fields)
+        start = time.perf_counter()
+        try:
+            with self._span(f"{phase} {fields['name']}" if fields.get('name') else phase):
+                yield
+        finally:
+            self._emit('phase_end', phase=phase, duration=time.perf_counter() - start, **fields)
+
+    def _span(self, name, category='phase', **args):
+        """Profiler span around a block (a no-op unless profiling)"""
+        if self.profiler is None:
+            return nullcontext()
+        return self.profiler.span(name, category, **args)
+
+    def write_profile(self, trace_path):
+        """Finish profiling: write the Chrome trace and print the summary (to stderr, even with --quiet/--json)"""
+        for line in self.profiler.finish(trace_path):
+            print(line, file=sys.stderr)
+
+    def _get_pool(self):
+        """Create the file-copy worker pool on first use and reuse it for the whole run"""
+        if self._pool is None:
+            pool_class = futures.ProcessPoolExecutor if self.executor == 'process' else futures.ThreadPoolExecutor
+            self._pool = pool_class(max_workers=self.jobs)
+        return self._pool
+
+    def _make_file_task(self, source, target, variables, settings=None, text=None, origin='local', blob=None):
+        """Describe one file copy for the worker pool.
+
+        ``text`` forces substitution on (True) or off (False); None classifies
+        the file from the extension lists in ``settings``. ``origin`` tags the
+        manifest entry with where the file came from (local sources or a git repo).
+        ``blob`` is (repo, oid, size) for sources read from a git object database.
+        """
+        settings = settings or {}
+        task = {
+            'source': source,
+            'target': target,
+            'origin': origin,
+            'substituter': self.get_substituter(variables),
+            'text': text,
+            'text_extensions': settings.get('text_extensions', DEFAULT_TEXT_EXTENSIONS),
+            'binary_extensions': settings.get('binary_extensions', DEFAULT_BINARY_EXTENSIONS),
+            'stream_threshold': settings.get('stream_threshold_bytes', DEFAULT_STREAM_THRESHOLD),
+            'link_mode': self.link_mode,
+            'blob': blob,
+            'source_key': self._manifest_source_key(source),
+            'index_entry': None,
+            'track': False,
+            'previous': None,
+            'profile': self.profiler is not None,
+        }
+        task['index_entry'] = self._get_source_index().get(task['source_key'])
+        manifest, target_key = self._manifest_lookup(target)
+        if manifest is not None:
+            task['track'] = True
+            task['previous'] = manifest['previous'].get(target_key)
+        return task
+
+    def _map_file_tasks(self, function, tasks):
+        """Map a task function over the worker pool (or serially), yielding results in task order"""
+        if self.jobs == 1 or len(tasks) == 1:
+            return map(function, tasks)
+        chunksize = 1 if self.executor == 'thread' else max(1, len(tasks) // (self.jobs * 4))
+        return self._get_pool().map(function, tasks, chunksize=chunksize)
+
+    def _create_directories(self, directories):
+        """Create each unique directory once, parents first"""
+        for directory in sorted(set(directories)):
+            directory.mkdir(parents=True, exist_ok=True)
+
+    def _run_file_tasks(self, tasks, copied_label="Copied"):
+        """Run file tasks on the worker pool and report results in task order"""
+        # Later tasks win when several sources map to the same target, as they would serially
+        tasks = list({task['target']: task for task in tasks}.values())
+        if not tasks:
+            return []
+
+        self._create_directories(task['target'].parent for task in tasks)
+        # Targets sharing a source and variable set (e.g. several AI tools) are one unit of
+        # work, so the source is read and substituted once and fanned out to every target
+        groups = {}
+        for task in tasks:
+            key = (task['source'], id(task['substituter']), task['text'],
+                   tuple(task['text_extensions']), tuple(task['binary_extensions']))
+            groups.setdefault(key, []).append(task)
+        results = (result for group in self._map_file_tasks(_provision_file_group, list(groups.values()))
+                   for result in group)
+
+        completed = []
+        for result in results:
+            if self.profiler is not None:
+                self.profiler.file_result(result)
+            self._record_manifest_entry(result['target'], result['entry'], result['origin'], result['tool'])
+            source, target = result['source'], self._staged_path(result['target'], reverse=True)
+            if result['index'] is not None:
+                self._source_index[self._manifest_source_key(result['source'])] = result['index']
+                self._source_index_dirty = True
+            for name in result['unknown']:
+                self.unknown_placeholders[name] = self.unknown_placeholders.get(name, 0) + 1
+            if result['action'] == 'unchanged':
+                self._manifest_lookup(result['target'])[0]['unchanged'] += 1
+                self._emit('file_skipped', source=source, target=target, reason='unchanged')
+            elif result['action'] == 'processed':
+                self._emit('file_copied', source=source, target=target, action='processed',
+                           method='substitute', label='Processed')
+            elif result['action'] == 'copied':
+                method = result['method'] or 'copy'
+                if method == 'copy':
+                    if self.link_mode != 'copy':
+                        self.link_fallbacks += 1
+                    label = "Copied from git repo:" if result['origin'].startswith('git:') else copied_label
+                else:
+                    label = LINK_LABELS[method]
+                self._emit('file_copied', source=source, target=target, action='copied', method=method, label=label)
+            else:
+                self._emit('file_failed', source=source, target=target, error=result['error'])
+                self.failed_files.append(result)
+            completed.append(result)
+        return completed
+
+    def _manifest_source_key(self, source):
+        """Manifest key for a source file: relative to base_dir when possible"""
+        source = str(source)
+        prefix = str(self.base_dir) + os.sep
+        if source.startswith(prefix):
+            return source[len(prefix):].replace(os.sep, '/')
+        return source
+
+    def _manifest_lookup(self, target):
+        """(manifest, key) of the innermost active manifest covering a target, or (None, None)"""
+        target = str(target)
+        for manifest in self._manifests:
+            prefix = manifest['prefix']
+            if target.startswith(prefix):
+                return manifest, target[len(prefix):].replace(os.sep, '/')
+        return None, None
+
+    def _get_source_index(self):
+        """Load the persisted source index (path -> size, mtime_ns, text, placeholders, hash)"""
+        if self._source_index is None:
+            self._source_index = {}
+            index_path = self.base_dir / PROVISION_CACHE_DIR / SOURCE_INDEX_NAME
+            try:
+                with open(index_path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                if isinstance(data, dict) and data.get('version') == SOURCE_INDEX_VERSION:
+                    self._source_index = data.get('files', {})
+            except (OSError, ValueError):
+                pass
+        return self._source_index
+
+    def get_stat_cache(self):
+        """Persistent stat -> hash cache of the files update compares"""
+        if self._stat_cache is None:
+            self._stat_cache = StatCache(self.base_dir / PROVISION_CACHE_DIR / STAT_CACHE_NAME, self.base_dir)
+        return self._stat_cache
+
+    def save_source_index(self):
+        """Persist the source index if this run added or refreshed entries"""
+        if not self._source_index_dirty or not self.persist_source_index:
+            return
+        cache_dir = self.base_dir / PROVISION_CACHE_DIR
+        cache_dir.mkdir(exist_ok=True)
+        index_path = cache_dir / SOURCE_INDEX_NAME
+        temp_path = index_path.with_name(f"{SOURCE_INDEX_NAME}.tmp")
+        data = {'version': SOURCE_INDEX_VERSION, 'files': self._source_index}
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            f.write(json.dumps(data, sort_keys=True, separators=(',', ':')))
+        os.replace(temp_path, index_path)
+        self._source_index_dirty = False
+
+    def _load_manifest(self, target_base):
+        """Load the provision manifest of a target directory (empty if missing or unreadable)"""
+        manifest_path = target_base / MANIFEST_NAME
+        try:
+            with open(manifest_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        if not isinstance(data, dict) or data.get('version') != MANIFEST_VERSION:
+            return {}
+        return data.get('files', {})
+
+    def _write_manifest(self, target_base, ai_tool, files):
+        """Atomically write the provision manifest of a target directory"""
+        manifest_path = target_base / MANIFEST_NAME
+        temp_path = manifest_path.with_name(f"{MANIFEST_NAME}.tmp")
+        data = {'version': MANIFEST_VERSION, 'ai_tool': ai_tool, 'files': files}
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            # Compact output keeps the C encoder in play; manifests can hold thousands of entries
+            f.write(json.dumps(data, sort_keys=True, separators=(',', ':')))
+        os.replace(temp_path, manifest_path)
+
+    def _begin_manifest(self, target_base, origins, tools=None):
+        """Start recording provisioned files for target_base against its previous manifest.
+
+        ``origins`` are the sources (local, git:<repo>) and ``tools`` the AI tools this
+        run provisions; previous entries from other origins or tools sharing the
+        directory are carried over untouched.
+        """
+        manifest = {
+            'target_base': target_base,
+            'prefix': str(target_base) + os.sep,
+            'previous': self._load_manifest(target_base),
+            'files': {},
+            'origins': set(origins),
+            'tools': set(tools or ()),
+            'unchanged': 0,
+        }
+        self._manifests.append(manifest)
+        # Innermost target directories first, so nested target bases resolve to their own manifest
+        self._manifests.sort(key=lambda m: len(m['prefix']), reverse=True)
+        return manifest
+
+    def _record_manifest_entry(self, target, entry=None, origin='local', tool=None):
+        """Record a provisioned target; without a new entry, its previous entry is kept"""
+        manifest, target_key = self._manifest_lookup(target)
+        if manifest is None:
+            return
+        if entry is None:
+            entry = manifest['previous'].get(target_key)
+            if entry is None:
+                return
+        else:
+            entry['origin'] = origin
+            if tool:
+                entry['tool'] = tool
+        manifest['files'][target_key] = entry
+    
+    def _foreign_entry(self, manifest, entry):
+        """Whether a previous entry comes from an origin or AI tool this run doesn't provision"""
+        if entry.get('origin', 'local') not in manifest['origins']:
+            return True
+        return bool(manifest['tools'] and entry.get('tool') and entry['tool'] not in manifest['tools'])
+
+    def _stale_manifest_entries(self, manifest, planned_keys):
+        """Previous manifest entries no longer produced: yields (target_key, entry, path)"""
+        for target_key, entry in sorted(manifest['previous'].items()):
+            if target_key in planned_keys or self._foreign_entry(manifest, entry):
+                continue
+            yield target_key, entry, manifest['target_base'] / target_key
+
+    def _finish_manifest(self, manifest, ai_tool):
+        """Remove stale provisioned files and write the new manifest"""
+        self._manifests.remove(manifest)
+        target_base = manifest['target_base']
+        files = manifest['files']
+
+        for target_key, entry in manifest['previous'].items():
+            if target_key not in files and self._foreign_entry(manifest, entry):
+                # Origin or tool not processed this run (e.g. git repos disabled): keep its files
+                files[target_key] = entry
+        with self._phase('prune', name=ai_tool):
+            for target_key, entry, stale_path in self._stale_manifest_entries(manifest, files):
+                if not os.path.lexists(stale_path):
+                    continue
+                if _target_removable(stale_path, entry):
+                    stale_path.unlink()
+                    self._emit('file_removed', target=stale_path, reason='stale')
+                else:
+                    self._say(f"  Warning: Keeping locally modified file no longer provisioned: {stale_path}",
+                              level='warning')
+
+        if manifest['unchanged']:
+            self._say(f"  Skipped {manifest['unchanged']} unchanged file(s)")
+        # Leave the manifest untouched on no-op runs so its mtime doesn't churn either
+        if files != manifest['previous'] or not (target_base / MANIFEST_NAME).exists():
+            self._write_manifest(target_base, ai_tool, files)
+
+    def _config_cache_dir(self):
+        return self.base_dir / PROVISION_CACHE_DIR / CONFIG_CACHE_DIR_NAME
+
+    def _load_yaml(self, path):
+        with self._span(f"load {path.name}", 'config'):
+            return load_yaml_config(path, self._config_cache_dir(), self.write_caches)
 
     def load_config(self):
         """Load the mapping configuration from map.yaml"""
-        with open(self.base_dir / "map.yaml", 'r', encoding='utf-8') as f:
-            return yaml.safe_load(f)
+        return self._load_yaml(self.base_dir / "map.yaml")
 
     def load_external_resources_config(self):
         """Load external resources repo mapping from external-resources.map.yaml"""
         if not self.external_resources_map.exists():
             raise FileNotFoundError(f"Missing external resources map: {self.external_resources_map}")
-        with open(self.external_resources_map, 'r', encoding='utf-8') as f:
-            return yaml.safe_load(f)
+        return self._load_yaml(self.external_resources_map)
     
     def load_provision_map_config(self):
         """Load provision mapping configuration from provision.map.yaml"""
+        if self.provision_config is not None:
+            return self.provision_config
         if not self.provision_map.exists():
             # Fall back to legacy map.yaml behavior
             return None
-        with open(self.provision_map, 'r', encoding='utf-8') as f:
-            return yaml.safe_load(f)
+        return self._load_yaml(self.provision_map)
     
+    def get_substituter(self, variables):
+        """Compiled substituter for a variable set, built once per run and shared by all mappings"""
+        key = tuple(sorted((str(name), str(value)) for name, value in (variables or {}).items()))
+        substituter = self._substituters.get(key)
+        if substituter is None:
+            substituter = self._substituters[key] = VariableSubstituter(dict(key))
+        return substituter
+
+    def get_renamer(self, transforms):
+        """Compiled file renamer for a file_transforms list, shared by every mapping using it"""
+        key = json.dumps(transforms or [], sort_keys=True)
+        renamer = self._renamers.get(key)
+        if renamer is None:
+            renamer = self._renamers[key] = FileRenamer(transforms)
+        return renamer
+
+    def report_unknown_placeholders(self):
+        """Print placeholders that had no value, then reset the tally"""
+        if self.unknown_placeholders:
+            names = ', '.join(
+                f"{{{{{name}}}}} ({count} file{'s' if count != 1 else ''})"
+                for name, count in sorted(self.unknown_placeholders.items())
+            )
+            self._say(f"  Warning: Unknown template placeholders left unchanged: {names}", level='warning')
+        self.unknown_placeholders = {}
+
+    def report_link_fallbacks(self):
+        """Print how many files were copied because the link mode wasn't supported, then reset"""
+        if self.link_fallbacks:
+            self._say(f"  Note: {self.link_mode} not supported for {self.link_fallbacks} file(s); copied instead")
+        self.link_fallbacks = 0
+
     def substitute_variables(self, content, variables):
         """Substitute template variables in content"""
-        if isinstance(content, str):
-            for key, value in variables.items():
-                content = content.replace(f"{{{{{key}}}}}", str(value))
-        return content
+        return self.get_substituter(variables).substitute(content)
     
     def process_file_with_variables(self, from_path, to_path, variables):
         """Copy file and substitute variables"""
-        try:
-            with open(from_path, 'r', encoding='utf-8') as f:
-                content = f.read()
-            
-            # Substitute variables
-            content = self.substitute_variables(content, variables)
-            
-            with open(to_path, 'w', encoding='utf-8') as f:
-                f.write(content)
-            
-            print(f"  Processed {from_path} -> {to_path}")
-        except UnicodeDecodeError:
-            # Binary file, just copy
-            shutil.copy2(from_path, to_path)
-            print(f"  Copied {from_path} -> {to_path}")
+        task = self._make_file_task(Path(from_path), Path(to_path), variables, text=True)
+        self._run_file_tasks([task])
             
-    def provision_project_type(self, project_type, variables=None):
+    def provision_project_type(self, project_type, variables=None, dry_run=False):
         """Provision base project structure for specified project type"""
+        with self._phase('provision', name=project_type):
+            with self._phase('plan', name=project_type):
+                plan = self.plan_project_type(project_type, variables)
+            if dry_run:
+                self.preview_plan(plan)
+                return
+            
+            self.execute_plan(plan)
+        self._say(f"Project type '{project_type}' provisioned successfully!")
+    
+    def plan_project_type(self, project_type, variables=None):
+        """Resolve a project type from map.yaml into a provisioning plan"""
         config = self.load_config()
         
         if 'project_types' not in config or project_type not in config['project_types']:
             raise ValueError(f"Unknown project type: {project_type}")
         
         project_config = config['project_types'][project_type]
-        default_variables = config.get('template_vars', {})
-        
-        # Merge variables
+        # Merge variables (into a copy: the loaded config is shared and read-only)
+        default_variables = dict(config.get('template_vars') or {})
         if variables:
             default_variables.update(variables)
         
-        print(f"Provisioning {project_config['name']}...")
-        print(f"  Description: {project_config['description']}")
+        self._say(f"Provisioning {project_config['name']}...")
+        self._say(f"  Description: {project_config['description']}")
         
+        plan = self._new_plan(project_config['name'], self.target_root)
         for file_config in project_config['files']:
             from_path = self.base_dir / file_config['from']
-            to_path = self.base_dir / file_config['to']
-            
-            # Create target directory if it doesn't exist
-            to_path.parent.mkdir(parents=True, exist_ok=True)
+            to_path = self.target_root / file_config['to']
             
             if from_path.is_file():
-                self.process_file_with_variables(from_path, to_path, default_variables)
+                plan['mappings'].append(('local', from_path, to_path))
+                self._add_plan_operation(plan, from_path, to_path, default_variables, text=True)
             elif from_path.is_dir():
-                if to_path.exists():
-                    shutil.rmtree(to_path)
-                self.copy_directory_with_variables(from_path, to_path, default_variables)
+                plan['mappings'].append(('local', from_path, to_path))
+                # Directory targets are replaced wholesale
+                plan['clean_dirs'].append(to_path)
+                self._plan_directory_copy(plan, from_path, to_path, default_variables)
             else:
-                print(f"  Warning: Source not found: {from_path}")
-        
-        print(f"Project type '{project_type}' provisioned successfully!")
+                self._say(f"  Warning: Source not found: {from_path}", level='warning')
+        return plan
+    
+    def _plan_directory_copy(self, plan, from_dir, to_dir, variables):
+        """Plan a recursive directory copy with variable substitution in text files"""
+        for item, _ in walk_files(from_dir):
+            self._add_plan_operation(plan, item, to_dir / item.relative_to(from_dir), variables, text=True)
+        plan['summaries'].append(f"  Copied directory {from_dir} -> {to_dir}")
     
     def copy_directory_with_variables(self, from_dir, to_dir, variables):
         """Copy directory recursively and substitute variables in text files"""
-        for item in from_dir.rglob('*'):
-            if item.is_file():
-                relative_path = item.relative_to(from_dir)
-                target_file = to_dir / relative_path
-                target_file.parent.mkdir(parents=True, exist_ok=True)
-                
-                self.process_file_with_variables(item, target_file, variables)
+        plan = self._new_plan(str(from_dir), to_dir)
+        self._plan_directory_copy(plan, from_dir, to_dir, variables)
+        self.execute_plan(plan)
+    
+    def _new_plan(self, name, target_base, manifest=False):
+        """Empty provisioning plan: file operations plus the side effects around them"""
+        return {
+            'name': name,
+            'target_base': target_base,
+            'manifest': manifest,  # Track outputs in target_base's provision manifest
+            'clean_dirs': [],  # Removed before any file is written
+            'operations': [],  # File copies, in the order a serial run would perform them
+            'targets': set(),
+            'kept': [],  # Existing files left alone (no-overwrite); manifest entries carry over
+            'origins': {'local'},
+            'tools': [name] if manifest else [],  # AI tools whose files the plan's manifest owns
+            'mappings': [],  # (label, source, target) per mapping, for plan summaries
+            'summaries': [],  # Printed once the operations have run
+        }
+    
+    def _add_plan_operation(self, plan, source, target, variables, settings=None, text=None, origin='local',
+                            blob=None):
+        """Add one file copy to a plan; ``blob`` reads the source from a git object instead of a file"""
+        plan['operations'].append({
+            'source': source,
+            'target': target,
+            'variables': variables,
+            'settings': settings,
+            'text': text,
+            'origin': origin,
+            'blob': blob,
+            'mapping': len(plan['mappings']) - 1,
+        })
+        plan['targets'].add(target)
+        self._emit('file_planned', source=source, target=target, origin=origin)
+    
+    def _plan_tasks(self, plan):
+        """Worker tasks for a plan's operations; later operations win on shared targets"""
+        operations = {op['target']: op for op in plan['operations']}.values()
+        tasks = []
+        for op in operations:
+            task = self._make_file_task(op['source'], self._staged_path(op['target']), op['variables'],
+                                        op['settings'], op['text'], op['origin'], op['blob'])
+            if plan['manifest']:
+                task['tool'] = op.get('tool', plan['name'])
+            tasks.append(task)
+        return tasks
+    
+    def _staged_path(self, path, reverse=False):
+        """Where path is built while its cleaned directory is staged (or, reversed, where it ends up)"""
+        if not self._staging:
+            return path
+        text = str(path)
+        for final, staging in self._staging.items():
+            old, new = (staging, final) if reverse else (final, staging)
+            if text == old or text.startswith(old + os.sep):
+                return Path(new + text[len(old):])
+        return path
+    
+    def _stage_clean_dirs(self, plans):
+        """Start a sibling staging directory for every directory the plans rebuild from scratch"""
+        clean_dirs = sorted({clean_dir for plan in plans for clean_dir in plan['clean_dirs']}, key=str)
+        for clean_dir in clean_dirs:
+            # Directories inside another cleaned directory are rebuilt as part of it
+            if any(str(clean_dir).startswith(final + os.sep) for final in self._staging):
+                continue
+            staging = clean_dir.with_name(clean_dir.name + STAGING_SUFFIX)
+            if os.path.lexists(staging):
+                # Left over from an interrupted run
+                shutil.rmtree(staging)
+            staging.mkdir(parents=True)
+            self._staging[str(clean_dir)] = str(staging)
+    
+    def _commit_staging(self):
+        """Swap every staged directory into place"""
+        staging, self._staging = self._staging, {}
+        for final, built in staging.items():
+            _swap_in_directory(Path(built), Path(final))
+    
+    def _discard_staging(self):
+        """Drop unfinished staging directories, leaving the live trees untouched"""
+        staging, self._staging = self._staging, {}
+        for built in staging.values():
+            shutil.rmtree(built, ignore_errors=True)
+    
+    def execute_plan(self, plan):
+        """Run a provisioning plan: clean, create each directory once, then copy on the worker pool"""
+        self.execute_plans([plan])
+    
+    def execute_plans(self, plans):
+        """Run several plans as one batch of file work.
+
+        Sources shared between plans are read and substituted once and written to
+        every target. Plans must not share a target_base. Directories that are
+        cleaned first are rebuilt in a sibling staging directory and swapped in
+        once complete, so the live tree is never half-built.
+        """
+        manifests = {}
+        try:
+            self._stage_clean_dirs(plans)
+            for plan in plans:
+                self._staged_path(plan['target_base']).mkdir(parents=True, exist_ok=True)
+                if plan['manifest']:
+                    manifests[plan['name']] = self._begin_manifest(self._staged_path(plan['target_base']),
+                                                                   plan['origins'], plan['tools'])
+            tasks = [task for plan in plans for task in self._plan_tasks(plan)]
+            with self._phase('execute', name=','.join(plan['name'] for plan in plans), total=len(tasks)):
+                self._run_file_tasks(tasks)
+            for plan in plans:
+                for kept_target in plan['kept']:
+                    staged_target = self._staged_path(kept_target)
+                    if staged_target != kept_target and kept_target.is_file():
+                        # Existing files kept by --no-overwrite carry over into the rebuilt tree
+                        staged_target.parent.mkdir(parents=True, exist_ok=True)
+                        _copy_file(kept_target, staged_target)
+                    self._record_manifest_entry(staged_target)
+                for summary in plan['summaries']:
+                    self._say(summary)
+                if plan['manifest']:
+                    self._finish_manifest(manifests[plan['name']], plan['name'])
+            self._commit_staging()
+        except BaseException:
+            self._discard_staging()
+            raise
+        finally:
+            self._manifests = []
+        
+        self.report_unknown_placeholders()
+        self.report_link_fallbacks()
+        self.save_source_index()
+        if self.failed_files:
+            self._say(f"  {len(self.failed_files)} file(s) failed to provision", level='error')
+    
+    def preview_plan(self, plan):
+        """Print a plan with counts, bytes and the predicted diff against the target, writing nothing"""
+        target_base = plan['target_base']
+        manifest = self._begin_manifest(target_base, plan['origins'], plan['tools']) if plan['manifest'] else None
+        try:
+            tasks = self._plan_tasks(plan)
+            predictions = list(self._map_file_tasks(_predict_file_task, tasks))
+            planned_keys = {self._manifest_lookup(task['target'])[1] for task in tasks}
+            stale = list(self._stale_manifest_entries(manifest, planned_keys)) if manifest else []
+        finally:
+            self._manifests = []
+        
+        deleted = []
+        modified = []
+        for target_key, entry, stale_path in stale:
+            if os.path.lexists(stale_path):
+                (deleted if _target_removable(stale_path, entry) else modified).append(stale_path)
+        # Cleaned directories lose every file the plan doesn't recreate
+        planned = {task['target'] for task in tasks}
+        for clean_dir in plan['clean_dirs']:
+            if clean_dir.exists():
+                # Everything in a cleaned directory goes, pruned names included
+                deleted.extend(existing for existing, _ in walk_files(clean_dir, prune=())
+                               if existing not in planned)
+        deleted = sorted(set(deleted) - set(modified))
+        
+        directories = {task['target'].parent for task in tasks}
+        total_bytes = sum(prediction['size'] for prediction in predictions)
+        states = {}
+        for prediction in predictions:
+            states.setdefault(prediction['state'], []).append(prediction)
+        write_bytes = sum(p['size'] for p in states.get('new', []) + states.get('changed', []))
         
-        print(f"  Copied directory {from_dir} -> {to_dir}")
+        self._say(f"Dry run: {plan['name']} -> {target_base}")
+        self._say(f"  Plan: {len(tasks)} files ({format_bytes(total_bytes)}) in {len(directories)} directories"
+                  f" from {len(plan['mappings'])} mappings")
+        per_mapping = {}
+        for op in {op['target']: op for op in plan['operations']}.values():
+            per_mapping[op['mapping']] = per_mapping.get(op['mapping'], 0) + 1
+        for index, (label, source, target) in enumerate(plan['mappings']):
+            self._say(f"    {label}: {source} -> {target} ({per_mapping.get(index, 0)} files)")
+        if plan['clean_dirs']:
+            self._say(f"  Cleans first: {', '.join(str(d) for d in plan['clean_dirs'])}")
+        if plan['kept']:
+            self._say(f"  Keeps {len(plan['kept'])} existing file(s) (overwrite disabled)")
+        self._say(f"  Predicted: {len(states.get('new', []))} new, {len(states.get('changed', []))} changed, "
+                  f"{len(states.get('unchanged', []))} unchanged, {len(deleted)} deleted "
+                  f"({format_bytes(write_bytes)} to write)")
+        for prediction in states.get('new', []):
+            self._say(f"    + {prediction['target']}")
+        for prediction in states.get('changed', []):
+            self._say(f"    ~ {prediction['target']}")
+        for path in deleted:
+            self._say(f"    - {path}")
+        for path in modified:
+            self._say(f"    ! {path} (locally modified, would be kept)")
+        for prediction in states.get('failed', []):
+            self._say(f"    Error: {prediction['source']}: {prediction['error']}", level='error')
+        self._say("  Dry run: no files were written")
+        return {'predictions': predictions, 'deleted': deleted, 'modified': modified}
             
-    def provision_ai_tool(self, ai_tool, concurrent_mode=False, git_repos=False, no_overwrite=False):
+    def provision_ai_tool(self, ai_tool, concurrent_mode=False, git_repos=False, no_overwrite=False, dry_run=False):
         """Provision template for specified AI tool"""
+        return self.provision_ai_tools([ai_tool], concurrent_mode, git_repos, no_overwrite, dry_run)
+    
+    def provision_ai_tools(self, ai_tools, concurrent_mode=False, git_repos=False, no_overwrite=False,
+                           dry_run=False):
+        """Provision several AI tools in one pass, reading and substituting shared sources once"""
         # Try new provision.map.yaml first, fall back to legacy map.yaml
         provision_config = self.load_provision_map_config()
         
         if provision_config:
-            return self._provision_ai_tool_new(ai_tool, provision_config, concurrent_mode, git_repos, no_overwrite)
+            return self._provision_ai_tool_new(ai_tools, provision_config, concurrent_mode, git_repos,
+                                               no_overwrite, dry_run)
+        elif dry_run:
+            raise ValueError("--dry-run requires provision.map.yaml")
         else:
-            return self._provision_ai_tool_legacy(ai_tool)
+            for ai_tool in ai_tools:
+                self._provision_ai_tool_legacy(ai_tool)
     
-    def _provision_ai_tool_new(self, ai_tool, provision_config, concurrent_mode=False, git_repos=False, no_overwrite=False):
-        """Provision AI tool using new provision.map.yaml format"""
-        if ai_tool not in provision_config['ai_tools']:
-            raise ValueError(f"Unknown AI tool: {ai_tool}")
+    def _provision_ai_tool_new(self, ai_tools, provision_config, concurrent_mode=False, git_repos=False,
+                               no_overwrite=False, dry_run=False):
+        """Provision AI tools using new provision.map.yaml format"""
+        for ai_tool in ai_tools:
+            if ai_tool not in provision_config['ai_tools']:
+                raise ValueError(f"Unknown AI tool: {ai_tool}")
         
-        tool_config = provision_config['ai_tools'][ai_tool]
         settings = provision_config.get('settings', {})
         concurrent_settings = provision_config.get('concurrent_support', {})
         
@@ -143,39 +2538,79 @@ class TemplateProvisioner:
             settings = settings.copy()
             settings['overwrite_existing_files'] = False
         
-        # Check for conflicts if concurrent mode is enabled
-        if concurrent_mode and concurrent_settings.get('enabled', True):
-            self._check_concurrent_conflicts(ai_tool, tool_config, provision_config)
-        
-        print(f"Provisioning {tool_config['name']} configuration...")
+        with self._phase('provision', name=','.join(ai_tools)):
+            if git_repos and self.fetch_git_repos and not dry_run:
+                # Every repo downloads concurrently while local mappings are planned
+                repo_keys = [repo_key for ai_tool in ai_tools
+                             for repo_key in provision_config['ai_tools'][ai_tool].get('git_repo_mappings', {})]
+                self.start_git_fetches(repo_keys, provision_config)
+            plans = []
+            for ai_tool in ai_tools:
+                tool_config = provision_config['ai_tools'][ai_tool]
+                self._say(f"Provisioning {tool_config['name']} configuration...")
+                with self._phase('plan', name=ai_tool):
+                    plans.append(self.plan_ai_tool(ai_tool, tool_config, settings))
+            # Git repo mappings last, so the fetches keep downloading while every tool's local mappings plan
+            for ai_tool, plan in zip(ai_tools, plans):
+                with self._phase('plan git repos', name=ai_tool):
+                    self.plan_ai_tool_git_repos(plan, provision_config['ai_tools'][ai_tool], provision_config,
+                                                settings, git_repos, fetch=self.fetch_git_repos and not dry_run)
+            
+            # Resolve per-file conflicts, then let tools sharing a directory share one manifest
+            if concurrent_mode and concurrent_settings.get('enabled', True):
+                self._resolve_plan_conflicts(plans, provision_config)
+                plans = self._merge_plans(plans)
+            if dry_run:
+                for plan in plans:
+                    self.preview_plan(plan)
+                return
+            
+            # Tools sharing a target directory run one after another; the rest share one batch
+            batches = []
+            for plan in plans:
+                for batch in batches:
+                    if all(other['target_base'] != plan['target_base'] for other in batch):
+                        batch.append(plan)
+                        break
+                else:
+                    batches.append([plan])
+            for batch in batches:
+                self.execute_plans(batch)
         
-        target_base = self.base_dir / tool_config['target_base']
+        for ai_tool in ai_tools:
+            self._say(f"{provision_config['ai_tools'][ai_tool]['name']} configuration completed!")
+    
+    def plan_ai_tool(self, ai_tool, tool_config, settings):
+        """Resolve an AI tool's local mappings and transforms into a provisioning plan"""
+        target_base = self.target_root / tool_config['target_base']
+        plan = self._new_plan(ai_tool, target_base, manifest=True)
         
         # Clean target directory if configured
-        if settings.get('clean_target_dirs', True) and target_base.exists():
-            shutil.rmtree(target_base)
+        if settings.get('clean_target_dirs', True):
+            plan['clean_dirs'].append(target_base)
         
-        target_base.mkdir(parents=True, exist_ok=True)
-        
-        # Process each mapping
+        # Plan each mapping
         for mapping in tool_config['mappings']:
-            self._process_mapping(mapping, target_base, settings)
-        
-        # Process git repository integrations if configured and enabled
+            with self._span(f"mapping {mapping.get('source')}", 'walk'):
+                self._plan_mapping(plan, mapping, target_base, settings)
+        return plan
+    
+    def plan_ai_tool_git_repos(self, plan, tool_config, provision_config, settings, git_repos=False, fetch=True):
+        """Add an AI tool's git repo mappings to its plan, waiting for their fetches.
+
+        With fetch False, git repos are read from their existing caches only.
+        """
+        ai_tool = plan['name']
         git_repo_mappings = tool_config.get('git_repo_mappings', {})
         if git_repos and git_repo_mappings:
-            print(f"  Processing git repository integrations...")
-            self._process_git_repo_mappings(git_repo_mappings, target_base, provision_config, settings)
+            self._say(f"  Processing git repository integrations for {tool_config['name']}...")
+            self._plan_git_repo_mappings(plan, git_repo_mappings, plan['target_base'], provision_config, settings,
+                                         fetch)
         elif git_repos and not git_repo_mappings:
-            print(f"  No git repository mappings configured for {ai_tool}")
+            self._say(f"  No git repository mappings configured for {ai_tool}")
         elif git_repo_mappings and not git_repos:
-            print(f"  Git repository integrations available but not enabled (use --git-repos flag)")
-        
-        # Track this AI tool as active
-        if concurrent_mode:
-            self.active_ai_tools.add(ai_tool)
-        
-        print(f"{tool_config['name']} configuration completed!")
+            self._say(f"  Git repository integrations for {ai_tool} available but not enabled (use --git-repos flag)")
+        return plan
     
     def _provision_ai_tool_legacy(self, ai_tool):
         """Provision AI tool using legacy map.yaml format"""
@@ -186,30 +2621,30 @@ class TemplateProvisioner:
             
         target_config = config['targets'][ai_tool]
         
-        print(f"Provisioning AI tool configuration for {ai_tool}...")
+        self._say(f"Provisioning AI tool configuration for {ai_tool}...")
         
         for copy_instruction in target_config['copies']:
             from_path = self.base_dir / copy_instruction['from']
-            to_path = self.base_dir / copy_instruction['to']
+            to_path = self.target_root / copy_instruction['to']
             
             # Create target directory if it doesn't exist
             to_path.parent.mkdir(parents=True, exist_ok=True)
             
             if from_path.is_file():
                 shutil.copy2(from_path, to_path)
-                print(f"  Copied {from_path} -> {to_path}")
+                self._say(f"  Copied {from_path} -> {to_path}")
             elif from_path.is_dir():
                 if to_path.exists():
                     shutil.rmtree(to_path)
                 shutil.copytree(from_path, to_path)
-                print(f"  Copied directory {from_path} -> {to_path}")
+                self._say(f"  Copied directory {from_path} -> {to_path}")
             else:
-                print(f"  Warning: Source not found: {from_path}")
+                self._say(f"  Warning: Source not found: {from_path}", level='warning')
         
         # Handle common/prompts copying with special rules
         self._copy_prompts_for_ai_tool(ai_tool)
                 
-        print(f"AI tool configuration for {ai_tool} completed!")
+        self._say(f"AI tool configuration for {ai_tool} completed!")
     
     def _copy_prompts_for_ai_tool(self, ai_tool):
         """Copy prompts with AI tool specific rules"""
@@ -226,36 +2661,36 @@ class TemplateProvisioner:
                 break
         
         if not prompts_source:
-            print(f"  Warning: No prompts found in {[str(s) for s in prompts_sources]}")
+            self._say(f"  Warning: No prompts found in {[str(s) for s in prompts_sources]}", level='warning')
             return
             
         if ai_tool == "claude-code":
             # For Claude: copy to .claude/commands and remove .prompt extension
-            prompts_target = self.base_dir / ".claude" / "commands"
+            prompts_target = self.target_root / ".claude" / "commands"
             prompts_target.mkdir(parents=True, exist_ok=True)
             
             for prompt_file in prompts_source.glob("*.prompt"):
                 target_name = prompt_file.name.replace(".prompt", "")
                 target_file = prompts_target / target_name
                 shutil.copy2(prompt_file, target_file)
-                print(f"  Copied {prompt_file} -> {target_file}")
+                self._say(f"  Copied {prompt_file} -> {target_file}")
                 
             # Also copy non-.prompt files (including .puml files)
             for prompt_file in prompts_source.iterdir():
                 if prompt_file.is_file() and not prompt_file.name.endswith(".prompt"):
                     target_file = prompts_target / prompt_file.name
                     shutil.copy2(prompt_file, target_file)
-                    print(f"  Copied {prompt_file} -> {target_file}")
+                    self._say(f"  Copied {prompt_file} -> {target_file}")
                     
         elif ai_tool == "copilot":
             # For Copilot: copy to .github/prompts
-            prompts_target = self.base_dir / ".github" / "prompts"
+            prompts_target = self.target_root / ".github" / "prompts"
             prompts_target.mkdir(parents=True, exist_ok=True)
             
             if prompts_target.exists():
                 shutil.rmtree(prompts_target)
             shutil.copytree(prompts_source, prompts_target)
-            print(f"  Copied directory {prompts_source} -> {prompts_target}")
+            self._say(f"  Copied directory {prompts_source} -> {prompts_target}")
         
     def list_available_ai_tools(self):
         """List all available AI tool templates"""
@@ -272,7 +2707,72 @@ class TemplateProvisioner:
         return config.get('project_types', {})
         
     def clean_provisioned_files(self, ai_tool):
-        """Clean up provisioned files for specified AI tool"""
+        """Remove the files provisioned for an AI tool, as recorded in its provision manifest.
+
+        Files changed since they were provisioned are reported and kept, as is anything
+        the manifest doesn't list; directories left empty are pruned. AI tools only
+        defined in the legacy map.yaml still have their copy destinations removed.
+        """
+        provision_config = self.load_provision_map_config()
+        if not provision_config or ai_tool not in provision_config.get('ai_tools', {}):
+            self._clean_legacy(ai_tool)
+            return
+        
+        target_base = self.target_root / provision_config['ai_tools'][ai_tool]['target_base']
+        recorded = self._load_manifest(target_base)
+        # Other AI tools sharing the directory keep their files
+        kept = {target_key: entry for target_key, entry in recorded.items() if entry.get('tool', ai_tool) != ai_tool}
+        files = {target_key: entry for target_key, entry in recorded.items() if target_key not in kept}
+        self._say(f"Cleaning provisioned files for {ai_tool}...")
+        if not files:
+            self._say(f"  Warning: No provision manifest in {target_base}; nothing recorded to clean",
+                      level='warning')
+            return
+        
+        tasks = [(str(target_base / target_key), entry) for target_key, entry in sorted(files.items())]
+        directories = set()
+        removed = 0
+        with self._phase('clean', name=ai_tool, total=len(tasks)):
+            for (_, entry), result in zip(tasks, self._map_file_tasks(_clean_file_task, tasks)):
+                target = Path(result['target'])
+                if result['action'] == 'removed':
+                    removed += 1
+                    self._emit('file_removed', target=target, reason='clean')
+                elif result['action'] == 'modified':
+                    self._say(f"  Warning: Keeping locally modified file: {target}", level='warning')
+                elif result['action'] == 'failed':
+                    self._say(f"  Error: Could not remove {target}: {result['error']}", level='error')
+                    self.failed_files.append(result)
+                if result['action'] in ('modified', 'failed'):
+                    kept[target.relative_to(target_base).as_posix()] = entry
+                else:
+                    directories.update(target.parents[:len(target.relative_to(target_base).parts)])
+        
+        # Modified files stay recorded, so a later provision or clean still knows them
+        if kept:
+            self._write_manifest(target_base, ','.join(sorted({entry.get('tool', ai_tool) for entry in kept.values()})),
+                                 kept)
+        else:
+            (target_base / MANIFEST_NAME).unlink(missing_ok=True)
+        
+        # Deepest first, so a directory is only tried once its subdirectories are gone
+        pruned = 0
+        for directory in sorted(directories, key=lambda path: len(path.parts), reverse=True):
+            try:
+                directory.rmdir()
+                pruned += 1
+            except OSError:
+                pass
+        
+        summary = f"  Removed {removed} file(s) and {pruned} empty director{'y' if pruned == 1 else 'ies'}"
+        modified = sum(1 for entry in kept.values() if entry.get('tool', ai_tool) == ai_tool)
+        if modified:
+            summary += f"; kept {modified} modified or unremovable file(s)"
+        self._say(summary)
+        self._say(f"Cleanup for {ai_tool} completed!")
+    
+    def _clean_legacy(self, ai_tool):
+        """Remove the copy destinations of a legacy map.yaml target"""
         config = self.load_config()
         
         if ai_tool not in config['targets']:
@@ -280,23 +2780,27 @@ class TemplateProvisioner:
             
         target_config = config['targets'][ai_tool]
         
-        print(f"Cleaning provisioned files for {ai_tool}...")
+        self._say(f"Cleaning provisioned files for {ai_tool}...")
         
         for copy_instruction in target_config['copies']:
-            to_path = self.base_dir / copy_instruction['to']
+            to_path = self.target_root / copy_instruction['to']
             
             if to_path.exists():
                 if to_path.is_file():
                     to_path.unlink()
-                    print(f"  Removed {to_path}")
+                    self._say(f"  Removed {to_path}")
                 elif to_path.is_dir():
                     shutil.rmtree(to_path)
-                    print(f"  Removed directory {to_path}")
+                    self._say(f"  Removed directory {to_path}")
                     
-        print(f"Cleanup for {ai_tool} completed!")
+        self._say(f"Cleanup for {ai_tool} completed!")
 
-    def pull_external_repo(self, repo_key, target_dir):
-        """Clone or update external repo and copy mapped folders into target_dir/subfolder"""
+    def pull_external_repo(self, repo_key, target_dir, checksum=False, full_copy=False):
+        """Clone or update external repo and sync mapped folders into target_dir/subfolder.
+
+        Folders are delta-synced (see _sync_directory); checksum compares the content of
+        every file, full_copy replaces each folder with a fresh copy instead.
+        """
         config = self.load_external_resources_config()
         if not config or not isinstance(config, dict) or 'repos' not in config or not config['repos'] or repo_key not in config['repos']:
             raise ValueError(f"Unknown repo key: {repo_key}")
@@ -305,349 +2809,497 @@ class TemplateProvisioner:
         subfolder = repo_cfg['subfolder']
         folders = repo_cfg['folders']
 
-        # Use a cache directory for repo clones
-        cache_dir = self.base_dir / '.external_repo_cache'
-        cache_dir.mkdir(exist_ok=True)
-        repo_local = cache_dir / repo_key
-
-        # Clone or update repo
-        if repo_local.exists():
-            print(f"Updating repo {repo_key}...")
-            os.system(f"cd {repo_local} && git pull")
-        else:
-            print(f"Cloning repo {repo_key} from {repo_url}...")
-            os.system(f"git clone {repo_url} {repo_local}")
+        # Use a cache directory for repo clones, pinned through provision.lock
+        repo_local = self._external_repo_cache_path(repo_key)
+        self._start_repo_sync('external_repos', repo_key, repo_url, repo_cfg.get('branch'), repo_local, folders)
+        if self._finish_repo_sync('external_repos', repo_key) is None:
+            return False
 
-        # Copy mapped folders into target_dir/subfolder
+        # Sync mapped folders into target_dir/subfolder
         target_base = Path(target_dir) / subfolder
-        for folder in folders:
-            src_folder = repo_local / folder
-            dst_folder = target_base / folder
-            if src_folder.exists():
-                if dst_folder.exists():
-                    shutil.rmtree(dst_folder)
-                shutil.copytree(src_folder, dst_folder)
-                print(f"  Copied {src_folder} -> {dst_folder}")
-            else:
-                print(f"  Warning: {src_folder} not found in repo {repo_key}")
+        totals = {'copied': 0, 'deleted': 0, 'unchanged': 0, 'bytes': 0}
+        try:
+            for folder in folders:
+                src_folder = repo_local / folder
+                dst_folder = target_base / folder
+                if not src_folder.exists():
+                    self._say(f"  Warning: {src_folder} not found in repo {repo_key}", level='warning')
+                elif full_copy:
+                    if dst_folder.exists():
+                        shutil.rmtree(dst_folder)
+                    shutil.copytree(src_folder, dst_folder)
+                    self._say(f"  Copied {src_folder} -> {dst_folder}")
+                else:
+                    stats = self._sync_directory(src_folder, dst_folder, checksum)
+                    for key in totals:
+                        totals[key] += stats[key]
+                    self._say(f"  Synced {src_folder} -> {dst_folder}: {stats['copied']} copied "
+                              f"({format_bytes(stats['bytes'])}), {stats['deleted']} deleted, "
+                              f"{stats['unchanged']} unchanged")
+        finally:
+            self.get_stat_cache().save()
+
+        self._say(f"External resources from {repo_key} pulled into {target_base}")
+        if not full_copy:
+            self._say(f"  {totals['copied']} file(s) copied ({format_bytes(totals['bytes'])}), "
+                      f"{totals['deleted']} deleted, {totals['unchanged']} unchanged")
+        return True
 
-        print(f"External resources from {repo_key} pulled into {target_base}")
+    def _sync_directory(self, src_dir, dst_dir, checksum=False):
+        """Make dst_dir a copy of src_dir, writing only what differs.
+
+        A destination file is unchanged when its size and mtime match the source (copies keep
+        the source mtime), or when its content hash does; checksum hashes every same-sized
+        pair. New and changed files are replaced atomically, files missing from the source
+        are deleted along with directories left empty. Returns file counts and bytes copied.
+        """
+        stats = {'copied': 0, 'deleted': 0, 'unchanged': 0, 'bytes': 0}
+        stat_cache = self.get_stat_cache()
+        if dst_dir.is_file():
+            dst_dir.unlink()
+        existing = {path.relative_to(dst_dir): entry for path, entry in walk_files(dst_dir, prune=())}
+        
+        for source, entry in walk_files(src_dir, prune=()):
+            relative = source.relative_to(src_dir)
+            target = dst_dir / relative
+            source_stat = entry.stat()
+            target_entry = existing.pop(relative, None)
+            if target_entry is not None and not target_entry.is_symlink():
+                target_stat = target_entry.stat()
+                if target_stat.st_size == source_stat.st_size and (
+                        (not checksum and target_stat.st_mtime_ns == source_stat.st_mtime_ns)
+                        or stat_cache.hash(target, target_stat) == stat_cache.hash(source, source_stat)):
+                    stats['unchanged'] += 1
+                    continue
+            # Anything in the way of the file or its directories goes first
+            for parent in reversed(relative.parents[:-1]):
+                blocker = dst_dir / parent
+                if blocker.is_symlink() or blocker.is_file():
+                    blocker.unlink()
+                    existing.pop(parent, None)
+            if target.is_dir() and not target.is_symlink():
+                for path, _ in walk_files(target, prune=()):
+                    existing.pop(path.relative_to(dst_dir), None)
+                shutil.rmtree(target)
+            target.parent.mkdir(parents=True, exist_ok=True)
+            temp_path = target.with_name(f"{target.name}.provision-sync")
+            shutil.copy2(source, temp_path)
+            os.replace(temp_path, target)
+            stats['copied'] += 1
+            stats['bytes'] += source_stat.st_size
+        
+        directories = set()
+        for relative in existing:
+            (dst_dir / relative).unlink()
+            stats['deleted'] += 1
+            directories.update(relative.parents[:-1])
+        # Deepest first, so a directory is only tried once its subdirectories are gone
+        for directory in sorted(directories, key=lambda path: len(path.parts), reverse=True):
+            try:
+                (dst_dir / directory).rmdir()
+            except OSError:
+                pass
+        return stats
     
-    def _process_git_repo_mappings(self, git_repo_mappings, target_base, provision_config, settings):
-        """Process git repository mappings for an AI tool"""
+    def _plan_git_repo_mappings(self, plan, git_repo_mappings, target_base, provision_config, settings, fetch=True):
+        """Plan git repository mappings for an AI tool"""
         git_repos_config = provision_config.get('git_repos', {})
         overwrite_existing = settings.get('overwrite_existing_files', True)
         
         for repo_key, repo_mapping_config in git_repo_mappings.items():
             if repo_key not in git_repos_config:
-                print(f"  Warning: Git repo '{repo_key}' not found in git_repos configuration")
+                self._say(f"  Warning: Git repo '{repo_key}' not found in git_repos configuration", level='warning')
                 continue
             
             repo_config = git_repos_config[repo_key]
             
             # Clone or update the repository
-            repo_cache_path = self._ensure_git_repo_cached(repo_key, repo_config)
+            if fetch:
+                repo_cache_path = self._ensure_git_repo_cached(repo_key, repo_config, provision_config)
+            else:
+                repo_cache_path = self._git_repo_cache_path(repo_key, repo_config)
+                if not _is_git_cache(repo_cache_path, bare=True):
+                    self._say(f"  Note: Git repo {repo_key} has no usable local cache; skipping its mappings "
+                              f"(a run that fetches git repos clones it)")
+                    continue
+            if repo_cache_path is None:
+                # Git failure, already reported
+                continue
+            if not repo_cache_path.exists():
+                self._say(f"  Warning: Repository cache path not found: {repo_cache_path}", level='warning')
+                continue
+            # Only repos that resolved take part in stale-file pruning
+            plan['origins'].add(f"git:{repo_key}")
             
-            # Process mappings for this repository
+            # Plan mappings for this repository
             mappings = repo_mapping_config.get('mappings', [])
             for mapping in mappings:
-                self._process_git_repo_mapping(repo_cache_path, mapping, target_base, settings, overwrite_existing)
+                self._plan_git_repo_mapping(plan, repo_key, repo_cache_path, mapping, target_base, settings,
+                                            overwrite_existing)
     
-    def _ensure_git_repo_cached(self, repo_key, repo_config):
-        """Ensure git repository is cloned and up to date"""
+    def _external_repo_cache_path(self, repo_key):
+        """Local cache path of an external-resources.map.yaml repo"""
+        return self.base_dir / '.external_repo_cache' / repo_key
+    
+    def _git_repo_cache_path(self, repo_key, repo_config):
+        """Local cache path of a git repository"""
         cache_dir = repo_config.get('cache_dir', '.git_repo_cache')
-        cache_base = self.base_dir / cache_dir
-        cache_base.mkdir(exist_ok=True)
-        
-        repo_cache_path = cache_base / repo_key
-        repo_url = repo_config['url']
-        branch = repo_config.get('branch', 'main')
+        return self.base_dir / cache_dir / repo_key
+    
+    def _git_sparse_paths(self, repo_key, provision_config):
+        """Paths of a git repo that provisioning reads: its folders plus every mapping source"""
+        repo_config = provision_config.get('git_repos', {}).get(repo_key, {})
+        paths = list(repo_config.get('folders', []))
+        for tool_config in provision_config.get('ai_tools', {}).values():
+            repo_mappings = tool_config.get('git_repo_mappings', {}).get(repo_key, {})
+            paths.extend(mapping['source'] for mapping in repo_mappings.get('mappings', []))
+        return paths
+    
+    def start_git_fetches(self, repo_keys, provision_config):
+        """Clone or update git repos in the background, so they download while local work is planned"""
+        git_repos_config = provision_config.get('git_repos', {})
+        for repo_key in sorted(set(repo_keys) & set(git_repos_config)):
+            repo_config = git_repos_config[repo_key]
+            # Mappings read straight from the object database, so these caches are bare
+            self._start_repo_sync('git_repos', repo_key, repo_config['url'], repo_config.get('branch', 'main'),
+                                  self._git_repo_cache_path(repo_key, repo_config),
+                                  self._git_sparse_paths(repo_key, provision_config), bare=True)
+    
+    def _start_repo_sync(self, section, repo_key, url, branch, cache_path, sparse_paths, bare=False):
+        """Submit one repo sync to the git pool, pinned to its provision.lock commit unless updating"""
+        if (section, repo_key) in self._git_fetches:
+            return
+        if self._git_pool is None:
+            self._git_pool = futures.ThreadPoolExecutor(max_workers=8)
+        pin = None if self.update_lock else self._lock_pin(section, repo_key, url, branch)
+        if _git_has_commit(cache_path, pin, bare):
+            self._say(f"  Using git repo {repo_key} at pinned commit {pin[:12]}")
+        elif _is_git_cache(cache_path, bare):
+            self._say(f"  Updating git repo {repo_key} from {url}...")
+        else:
+            self._say(f"  Cloning git repo {repo_key} from {url}...")
+        sync = _sync_git_repo
+        if self.profiler is not None:
+            sync = self.profiler.traced(sync, f"git sync {repo_key}", 'git')
+        fetch = self._git_pool.submit(sync, url, branch, cache_path, sparse_paths, pin, bare)
+        self._git_fetches[(section, repo_key)] = (cache_path, fetch, url, branch)
+    
+    def _finish_repo_sync(self, section, repo_key):
+        """Wait for a repo sync and pin its commit in provision.lock; None if git failed"""
+        cache_path, fetch, url, branch = self._git_fetches[(section, repo_key)]
+        if fetch is None:
+            return cache_path
         
         try:
-            if repo_cache_path.exists():
-                print(f"  Updating git repo {repo_key}...")
-                os.system(f"cd {repo_cache_path} && git fetch && git reset --hard origin/{branch}")
-            else:
-                print(f"  Cloning git repo {repo_key} from {repo_url}...")
-                os.system(f"git clone -b {branch} {repo_url} {repo_cache_path}")
-        except Exception as e:
-            print(f"  Error with git repo {repo_key}: {e}")
-            return None
+            with self._span(f"git wait {repo_key}", 'git'):
+                action, commit, tree = fetch.result()
+            self._record_lock(section, repo_key, url, branch, commit, tree)
+        except subprocess.CalledProcessError as e:
+            self._say(f"  Error with git repo {repo_key}: git {e.cmd[1]} exited with status {e.returncode}",
+                      level='error')
+            if e.stderr:
+                self._say(f"  Git stderr: {e.stderr.strip()}", level='error')
+            cache_path = None
+        except OSError as e:
+            self._say(f"  Error with git repo {repo_key}: {e}", level='error')
+            cache_path = None
+        if cache_path is None:
+            self.failed_git_repos.append(repo_key)
+        # Later mappings of the same repo reuse the outcome
+        self._git_fetches[(section, repo_key)] = (cache_path, None, url, branch)
+        return cache_path
+    
+    def _ensure_git_repo_cached(self, repo_key, repo_config, provision_config=None):
+        """Ensure git repository is cloned and up to date; None if git failed"""
+        self.start_git_fetches([repo_key], provision_config or {'git_repos': {repo_key: repo_config}})
+        return self._finish_repo_sync('git_repos', repo_key)
+    
+    def _load_lock(self):
+        """provision.lock: pinned commit and tree per git repo and external repo"""
+        if self._lock is None:
+            self._lock = {'version': LOCK_VERSION, 'git_repos': {}, 'external_repos': {}}
+            try:
+                with open(self.base_dir / LOCK_NAME, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                if isinstance(data, dict) and data.get('version') == LOCK_VERSION:
+                    self._lock.update(data)
+            except (OSError, ValueError):
+                pass
+        return self._lock
+    
+    def _lock_pin(self, section, repo_key, url, branch):
+        """Pinned commit for a repo, or None when unpinned or its url/branch changed"""
+        entry = self._load_lock()[section].get(repo_key)
+        if entry and entry.get('url') == url and entry.get('branch') == branch:
+            return entry.get('commit')
+        return None
+    
+    def _record_lock(self, section, repo_key, url, branch, commit, tree):
+        """Pin a repo to the commit it was synced to and save provision.lock if that changed it"""
+        lock = self._load_lock()
+        entry = {'url': url, 'branch': branch, 'commit': commit, 'tree': tree}
+        if lock[section].get(repo_key) != entry:
+            lock[section][repo_key] = entry
+            self.save_lock()
+    
+    def save_lock(self):
+        """Atomically write provision.lock"""
+        lock_path = self.base_dir / LOCK_NAME
+        temp_path = lock_path.with_name(f"{LOCK_NAME}.tmp")
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            # Meant to be committed, so keep it readable and diff-friendly
+            f.write(json.dumps(self._load_lock(), indent=2, sort_keys=True) + '\n')
+        os.replace(temp_path, lock_path)
+    
+    def lock_repos(self, update=False):
+        """Resolve and pin every configured git repo and external repo in provision.lock.
+
+        Existing pins are kept (and fetched if missing locally) unless update is set,
+        which moves every pin to its branch's current commit.
+        """
+        self.update_lock = update
+        provision_config = self.load_provision_map_config() or {}
+        git_repos_config = provision_config.get('git_repos', {})
+        self.start_git_fetches(git_repos_config, provision_config)
+        external_config = {}
+        if self.external_resources_map.exists():
+            external_config = (self.load_external_resources_config() or {}).get('repos') or {}
+        for repo_key, repo_cfg in external_config.items():
+            self._start_repo_sync('external_repos', repo_key, repo_cfg['url'], repo_cfg.get('branch'),
+                                  self._external_repo_cache_path(repo_key), repo_cfg.get('folders', []))
         
-        return repo_cache_path
+        lock = self._load_lock()
+        for section, configured in (('git_repos', git_repos_config), ('external_repos', external_config)):
+            for repo_key in sorted(configured):
+                if self._finish_repo_sync(section, repo_key) is not None:
+                    self._say(f"  {repo_key}: {lock[section][repo_key]['commit']}")
+            # Repos no longer configured lose their pins
+            for repo_key in sorted(set(lock[section]) - set(configured)):
+                del lock[section][repo_key]
+                self._say(f"  Removed pin for {repo_key}")
+        self.save_lock()
+        self._say(f"Pinned {sum(len(lock[section]) for section in ('git_repos', 'external_repos'))} "
+                  f"repo(s) in {LOCK_NAME}")
+        return not self.failed_git_repos
     
-    def _process_git_repo_mapping(self, repo_cache_path, mapping, target_base, settings, overwrite_existing):
-        """Process a single git repository mapping"""
-        if not repo_cache_path or not repo_cache_path.exists():
-            print(f"  Warning: Repository cache path not found: {repo_cache_path}")
-            return
-            
-        source_path = repo_cache_path / mapping['source']
+    def _plan_git_repo_mapping(self, plan, repo_key, repo_cache_path, mapping, target_base, settings,
+                               overwrite_existing):
+        """Plan a single git repository mapping from the blobs at the cache's HEAD"""
+        source = mapping['source'].strip('/')
+        source_path = repo_cache_path / source
         target_path = target_base / mapping['target']
         
-        if not source_path.exists():
-            print(f"  Warning: Source path not found in git repo: {source_path}")
+        blobs = list(_git_ls_tree(repo_cache_path, [source]))
+        if not blobs:
+            self._say(f"  Warning: Source path not found in git repo: {source_path}", level='warning')
             return
         
-        # Create target directory
-        target_path.parent.mkdir(parents=True, exist_ok=True)
-        
-        if source_path.is_file():
-            self._process_git_repo_file(source_path, target_path, mapping, settings, overwrite_existing)
-        elif source_path.is_dir():
-            self._process_git_repo_directory(source_path, target_path, mapping, settings, overwrite_existing)
+        plan['mappings'].append((f"git:{repo_key}", source_path, target_path))
+        origin = f"git:{repo_key}"
+        if len(blobs) == 1 and blobs[0][0] == source:
+            self._plan_git_repo_file(plan, origin, repo_cache_path, blobs[0], target_path, mapping, settings,
+                                     overwrite_existing)
+        else:
+            self._plan_git_repo_directory(plan, origin, repo_cache_path, source, blobs, target_path, mapping,
+                                          settings, overwrite_existing)
     
-    def _process_git_repo_file(self, source_path, target_path, mapping, settings, overwrite_existing):
-        """Process a single file from git repository with transforms"""
-        transforms = mapping.get('file_transforms', [])
-        
-        # Apply file name transformations
-        final_target = target_path
-        for transform in transforms:
-            final_target = self._apply_file_transform(source_path, final_target, transform)
+    def _plan_existing_target(self, plan, final_target, overwrite_existing):
+        """Whether a git repo file must be left alone because its target exists and overwrite is off"""
+        if overwrite_existing:
+            return False
+        if final_target in plan['targets'] or final_target.exists():
+            self._emit('file_skipped', source=None, target=final_target, reason='existing')
+            plan['kept'].append(final_target)
+            return True
+        return False
+    
+    def _plan_git_repo_file(self, plan, origin, repo_cache_path, blob, target_path, mapping, settings,
+                            overwrite_existing):
+        """Plan a single file from git repository with transforms"""
+        path, oid, size = blob
+        source_path = repo_cache_path / path
+        renamer = self.get_renamer(mapping.get('file_transforms'))
+        final_target = renamer.target(source_path.name, target_path)
         
         # Check if we should skip existing files
-        if final_target.exists() and not overwrite_existing:
-            print(f"  Skipping existing file: {final_target}")
+        if self._plan_existing_target(plan, final_target, overwrite_existing):
             return
         
         # Copy file with variable substitution if it's a text file
-        if self._is_text_file(source_path, settings):
-            variables = settings.get('template_vars', {})
-            self.process_file_with_variables(source_path, final_target, variables)
-        else:
-            shutil.copy2(source_path, final_target)
-            print(f"  Copied from git repo: {source_path} -> {final_target}")
-    
-    def _process_git_repo_directory(self, source_path, target_path, mapping, settings, overwrite_existing):
-        """Process a directory from git repository with transforms"""
-        transforms = mapping.get('file_transforms', [])
-        
-        # Create target directory
-        target_path.mkdir(parents=True, exist_ok=True)
-        
-        # Process each file in the directory
-        for item in source_path.rglob('*'):
-            if item.is_file():
-                relative_path = item.relative_to(source_path)
-                target_file = target_path / relative_path
-                
-                # Apply file transformations
-                final_target = target_file
-                for transform in transforms:
-                    final_target = self._apply_file_transform(item, final_target, transform)
-                
-                # Check if we should skip existing files
-                if final_target.exists() and not overwrite_existing:
-                    print(f"  Skipping existing file: {final_target}")
-                    continue
-                
-                # Ensure target directory exists
-                final_target.parent.mkdir(parents=True, exist_ok=True)
-                
-                # Copy file with variable substitution if it's a text file
-                if self._is_text_file(item, settings):
-                    variables = settings.get('template_vars', {})
-                    self.process_file_with_variables(item, final_target, variables)
-                else:
-                    shutil.copy2(item, final_target)
-                    print(f"  Copied from git repo: {item} -> {final_target}")
-        
-        print(f"  Copied git repo directory {source_path} -> {target_path}")
+        variables = settings.get('template_vars', {})
+        self._add_plan_operation(plan, source_path, final_target, variables, settings, origin=origin,
+                                 blob=(str(repo_cache_path), oid, size))
     
-    def _apply_file_transform(self, source_file, target_file, transform):
-        """Apply a single file transformation rule"""
-        import re
+    def _plan_git_repo_directory(self, plan, origin, repo_cache_path, source, blobs, target_path, mapping,
+                                 settings, overwrite_existing):
+        """Plan a directory from git repository with transforms"""
+        renamer = self.get_renamer(mapping.get('file_transforms'))
         
-        if transform.get('preserve_all', False):
-            # Keep all files as-is
-            return target_file
-        elif transform.get('preserve_others', False):
-            # Only apply specific transforms, keep others as-is
-            if 'from_extension' in transform and 'to_extension' in transform:
-                if source_file.name.endswith(transform['from_extension']):
-                    new_name = source_file.name.replace(
-                        transform['from_extension'],
-                        transform['to_extension']
-                    )
-                    return target_file.parent / new_name
-            elif 'from_pattern' in transform and 'to_pattern' in transform:
-                pattern = transform['from_pattern']
-                replacement = transform['to_pattern']
-                new_name = re.sub(pattern, replacement, source_file.name)
-                if new_name != source_file.name:
-                    return target_file.parent / new_name
-            return target_file
-        elif 'from_extension' in transform and 'to_extension' in transform:
-            if source_file.name.endswith(transform['from_extension']):
-                new_name = source_file.name.replace(
-                    transform['from_extension'],
-                    transform['to_extension']
-                )
-                return target_file.parent / new_name
-        elif 'from_pattern' in transform and 'to_pattern' in transform:
-            pattern = transform['from_pattern']
-            replacement = transform['to_pattern']
-            new_name = re.sub(pattern, replacement, source_file.name)
-            return target_file.parent / new_name
+        # Collect each file in the directory
+        variables = settings.get('template_vars', {})
+        for path, oid, size in sorted(blobs):
+            item = repo_cache_path / path
+            final_target = renamer.target(item.name, target_path / path[len(source):].lstrip('/'))
+            
+            # Check if we should skip existing files
+            if self._plan_existing_target(plan, final_target, overwrite_existing):
+                continue
+            
+            # Copy file with variable substitution if it's a text file
+            self._add_plan_operation(plan, item, final_target, variables, settings, origin=origin,
+                                     blob=(str(repo_cache_path), oid, size))
         
-        return target_file
+        plan['summaries'].append(f"  Copied git repo directory {repo_cache_path / source} -> {target_path}")
     
-    def _check_concurrent_conflicts(self, ai_tool, tool_config, provision_config):
-        """Check for conflicts when provisioning multiple AI tools concurrently"""
+    def _resolve_plan_conflicts(self, plans, provision_config):
+        """Apply conflict_resolution and shared_files per file across the AI tools of a concurrent run.
+
+        Files other tools recorded in the plans' manifests, then every planned target, go
+        into a PathTrie; a path claimed by two tools is a conflict. Shared files and 'skip'
+        keep the first tool's file, 'overwrite' the last one's. 'backup' keeps the last
+        one's with the earlier rendering next to it as <name>.<tool>.backup (a file another
+        tool provisioned before this run stays, and this tool's version goes aside).
+        'error', and a file where another tool needs a directory (or the reverse), raise
+        ValueError.
+        """
         concurrent_settings = provision_config.get('concurrent_support', {})
         conflict_resolution = concurrent_settings.get('conflict_resolution', 'error')
+        shared_files = concurrent_settings.get('shared_files', [])
+        tools = {plan['name'] for plan in plans}
+        trie = PathTrie()
+        for target_base in {plan['target_base'] for plan in plans}:
+            for target_key, entry in self._load_manifest(target_base).items():
+                if entry.get('tool') and entry['tool'] not in tools:
+                    target = target_base / target_key
+                    trie.insert(target.parts, {'tool': entry['tool'], 'target': target, 'recorded': True})
         
-        target_base = self.base_dir / tool_config['target_base']
-        
-        # Check if target directory would conflict with existing AI tool directories
-        for active_tool in self.active_ai_tools:
-            if active_tool == ai_tool:
-                continue
-                
-            active_tool_config = provision_config['ai_tools'][active_tool]
-            active_target_base = self.base_dir / active_tool_config['target_base']
-            
-            # Check for overlapping target directories
-            if target_base == active_target_base:
-                if conflict_resolution == 'error':
-                    raise ValueError(f"Conflict: {ai_tool} and {active_tool} both target {target_base}")
-                elif conflict_resolution == 'skip':
-                    print(f"  Skipping {ai_tool} due to conflict with {active_tool}")
-                    return False
+        conflicts = []
+        dropped = set()
+        resolved = {}  # (message, tool, other tool) -> count
+        for plan in plans:
+            for op in plan['operations']:
+                op['tool'] = plan['name']
+                target = op['target']
+                other, kind = trie.insert(target.parts, op)
+                if other is None:
+                    continue
+                if other['tool'] == op['tool']:
+                    # The same tool mapping a target twice: later wins, as in a single-tool run
+                    trie.insert(target.parts, op, replace=True)
+                    continue
+                if kind != 'file':
+                    conflicts.append(f"{other['target']} ({other['tool']}) and {target} ({op['tool']}) "
+                                     f"need the same path as a file and a directory")
+                    continue
+                relative = os.path.relpath(target, self.target_root)
+                if any(fnmatch.fnmatch(target.name, pattern) or fnmatch.fnmatch(relative, pattern)
+                       for pattern in shared_files):
+                    # Shared: the first tool's copy serves every tool
+                    dropped.add(id(op))
+                    continue
+                if conflict_resolution == 'skip':
+                    dropped.add(id(op))
+                    self._emit('file_skipped', source=op['source'], target=target, reason='conflict')
+                    message = "{tool}: skipped {count} file(s) already provisioned by {other}"
+                elif conflict_resolution == 'overwrite':
+                    if not other.get('recorded'):
+                        dropped.add(id(other))
+                    trie.insert(target.parts, op, replace=True)
+                    message = "{tool}: overwrites {count} file(s) of {other}"
                 elif conflict_resolution == 'backup':
-                    backup_path = target_base.with_suffix(f".{active_tool}.backup")
-                    if target_base.exists():
-                        shutil.move(str(target_base), str(backup_path))
-                        print(f"  Backed up {target_base} to {backup_path}")
-        
-        return True
+                    if other.get('recorded'):
+                        op['target'] = target.with_name(f"{target.name}.{op['tool']}.backup")
+                        message = "{tool}: wrote {count} file(s) provisioned by {other} to *.{tool}.backup"
+                    else:
+                        other['target'] = target.with_name(f"{target.name}.{other['tool']}.backup")
+                        trie.insert(target.parts, op, replace=True)
+                        message = "{tool}: provisions {count} file(s) {other} also planned; theirs: *.{other}.backup"
+                else:
+                    conflicts.append(f"{target} ({other['tool']} and {op['tool']})")
+                    continue
+                key = (message, op['tool'], other['tool'])
+                resolved[key] = resolved.get(key, 0) + 1
+        if conflicts:
+            shown = '\n  '.join(conflicts[:20])
+            more = f"\n  ... and {len(conflicts) - 20} more" if len(conflicts) > 20 else ''
+            raise ValueError(f"{len(conflicts)} conflicting target(s) between AI tools "
+                             f"(conflict_resolution: {conflict_resolution}):\n  {shown}{more}")
+        for (message, tool, other), count in resolved.items():
+            self._say("  " + message.format(tool=tool, other=other, count=count))
+        for plan in plans:
+            plan['operations'] = [op for op in plan['operations'] if id(op) not in dropped]
+            plan['targets'] = {op['target'] for op in plan['operations']}
+    
+    def _merge_plans(self, plans):
+        """Combine plans with the same target_base into one plan (and manifest) per directory"""
+        merged = {}
+        for plan in plans:
+            combined = merged.get(plan['target_base'])
+            if combined is None:
+                merged[plan['target_base']] = plan
+                continue
+            combined['name'] = f"{combined['name']},{plan['name']}"
+            combined['tools'].extend(plan['tools'])
+            for op in plan['operations']:
+                op['mapping'] += len(combined['mappings'])
+            for key in ('operations', 'clean_dirs', 'kept', 'mappings', 'summaries'):
+                combined[key].extend(plan[key])
+            combined['targets'] |= plan['targets']
+            combined['origins'] |= plan['origins']
+        return list(merged.values())
     
-    def _process_mapping(self, mapping, target_base, settings):
-        """Process a single mapping from provision.map.yaml"""
+    def _plan_mapping(self, plan, mapping, target_base, settings):
+        """Plan a single mapping from provision.map.yaml"""
         source_path = self.base_dir / mapping['source']
         target_path = target_base / mapping['target']
         
         if not source_path.exists():
-            print(f"  Warning: Source not found: {source_path}")
+            self._say(f"  Warning: Source not found: {source_path}", level='warning')
             return
         
-        # Create target directory
-        target_path.parent.mkdir(parents=True, exist_ok=True)
-        
+        plan['mappings'].append(('local', source_path, target_path))
         if source_path.is_file():
-            self._process_file_mapping(source_path, target_path, mapping, settings)
+            self._plan_file_mapping(plan, source_path, target_path, mapping, settings)
         elif source_path.is_dir():
-            self._process_directory_mapping(source_path, target_path, mapping, settings)
-    
-    def _process_file_mapping(self, source_path, target_path, mapping, settings):
-        """Process a single file mapping with transforms"""
-        transforms = mapping.get('file_transforms', [])
-        
-        # Apply file name transformations
-        final_target = target_path
-        for transform in transforms:
-            if 'from_extension' in transform and 'to_extension' in transform:
-                if source_path.name.endswith(transform['from_extension']):
-                    new_name = source_path.name.replace(
-                        transform['from_extension'], 
-                        transform['to_extension']
-                    )
-                    final_target = target_path.parent / new_name
-                    break
+            self._plan_directory_mapping(plan, source_path, target_path, mapping, settings)
+    
+    def _plan_file_mapping(self, plan, source_path, target_path, mapping, settings):
+        """Plan a single file mapping with transforms"""
+        renamer = self.get_renamer(mapping.get('file_transforms'))
+        final_target = renamer.target(source_path.name, target_path)
         
         # Copy file with variable substitution if it's a text file
-        if self._is_text_file(source_path, settings):
-            variables = settings.get('template_vars', {})
-            self.process_file_with_variables(source_path, final_target, variables)
-        else:
-            shutil.copy2(source_path, final_target)
-            print(f"  Copied {source_path} -> {final_target}")
+        variables = settings.get('template_vars', {})
+        self._add_plan_operation(plan, source_path, final_target, variables, settings)
     
-    def _process_directory_mapping(self, source_path, target_path, mapping, settings):
-        """Process a directory mapping with transforms"""
-        transforms = mapping.get('file_transforms', [])
+    def _plan_directory_mapping(self, plan, source_path, target_path, mapping, settings):
+        """Plan a directory mapping with transforms"""
+        renamer = self.get_renamer(mapping.get('file_transforms'))
         
-        # Clean target if it exists
-        if target_path.exists():
-            shutil.rmtree(target_path)
-        
-        target_path.mkdir(parents=True, exist_ok=True)
-        
-        # Process each file in the directory
-        for item in source_path.rglob('*'):
-            if item.is_file():
-                relative_path = item.relative_to(source_path)
-                target_file = target_path / relative_path
-                
-                # Apply file transformations
-                final_target = target_file
-                for transform in transforms:
-                    if transform.get('preserve_all', False):
-                        # Keep all files as-is
-                        break
-                    elif transform.get('preserve_others', False):
-                        # Only transform specific extensions, keep others as-is
-                        if ('from_extension' in transform and 
-                            item.name.endswith(transform['from_extension'])):
-                            new_name = item.name.replace(
-                                transform['from_extension'],
-                                transform['to_extension']
-                            )
-                            final_target = target_file.parent / new_name
-                        break
-                    elif 'from_extension' in transform and 'to_extension' in transform:
-                        if item.name.endswith(transform['from_extension']):
-                            new_name = item.name.replace(
-                                transform['from_extension'],
-                                transform['to_extension']
-                            )
-                            final_target = target_file.parent / new_name
-                            break
-                
-                # Ensure target directory exists
-                final_target.parent.mkdir(parents=True, exist_ok=True)
-                
-                # Copy file with variable substitution if it's a text file
-                if self._is_text_file(item, settings):
-                    variables = settings.get('template_vars', {})
-                    self.process_file_with_variables(item, final_target, variables)
-                else:
-                    shutil.copy2(item, final_target)
-                    print(f"  Copied {item} -> {final_target}")
+        if mapping.get('clean'):
+            # Replaced wholesale, files it never provisioned included
+            plan['clean_dirs'].append(target_path)
+        # Otherwise files no longer produced by the mapping are pruned through the provision manifest
+        # Collect each file in the directory
+        variables = settings.get('template_vars', {})
+        for item, _ in walk_files(source_path):
+            final_target = renamer.target(item.name, target_path / item.relative_to(source_path))
+            
+            # Copy file with variable substitution if it's a text file
+            self._add_plan_operation(plan, item, final_target, variables, settings)
         
-        print(f"  Copied directory {source_path} -> {target_path}")
+        plan['summaries'].append(f"  Copied directory {source_path} -> {target_path}")
     
-    def _is_text_file(self, file_path, settings):
-        """Determine if a file should be treated as text for variable substitution"""
-        text_extensions = settings.get('text_extensions', [
-            '.md', '.yml', '.yaml', '.json', '.js', '.ts', '.py', '.prompt'
-        ])
-        binary_extensions = settings.get('binary_extensions', [
-            '.png', '.jpg', '.jpeg', '.gif', '.ico', '.pdf'
-        ])
-        
-        file_ext = file_path.suffix.lower()
-        
-        if file_ext in binary_extensions:
-            return False
-        if file_ext in text_extensions:
-            return True
-        
-        # Default: try to detect if file is text
-        try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                f.read(1024)  # Read first 1KB to test
-            return True
-        except (UnicodeDecodeError, PermissionError):
-            return False
-
     def update_from_template_repo(self, template_repo_url=None, branch='main', force=False, backup=True):
-        """Update local files from the agentic-template repository if repo files are newer"""
+        """Update local files from the agentic-template repository.
+
+        Only files that changed upstream since the last applied template commit are looked at,
+        and of those only files not modified locally are overwritten (see _update_file).
+        """
         if template_repo_url is None:
             template_repo_url = "https://github.com/armoin2018/agentic-template.git"
         
-        print(f"Updating from agentic-template repository: {template_repo_url}")
+        self._say(f"Updating from agentic-template repository: {template_repo_url}")
         
         # Create cache directory for the template repo
         cache_dir = self.base_dir / '.template_repo_cache'
@@ -657,7 +3309,7 @@ class TemplateProvisioner:
         # Clone or update the template repository
         try:
             if template_repo_path.exists():
-                print("  Updating existing template repository...")
+                self._say("  Updating existing template repository...")
                 result = subprocess.run(
                     ['git', 'pull', 'origin', branch],
                     cwd=template_repo_path,
@@ -665,19 +3317,19 @@ class TemplateProvisioner:
                     text=True,
                     check=True
                 )
-                print(f"  Git pull result: {result.stdout.strip()}")
+                self._say(f"  Git pull result: {result.stdout.strip()}")
             else:
-                print("  Cloning template repository...")
+                self._say("  Cloning template repository...")
                 result = subprocess.run(
                     ['git', 'clone', '-b', branch, template_repo_url, str(template_repo_path)],
                     capture_output=True,
                     text=True,
                     check=True
                 )
-                print("  Repository cloned successfully")
+                self._say("  Repository cloned successfully")
         except subprocess.CalledProcessError as e:
-            print(f"  Error with git operation: {e}")
-            print(f"  Git stderr: {e.stderr}")
+            self._say(f"  Error with git operation: {e}", level='error')
+            self._say(f"  Git stderr: {e.stderr}", level='error')
             return False
         
         # Define files/directories to update from template
@@ -690,116 +3342,504 @@ class TemplateProvisioner:
             'map.yaml',
             '.github/copilot-instructions.md'
         ]
+        pathspecs = [update_path.rstrip('/') for update_path in update_paths]
+        for update_path in update_paths:
+            if not (template_repo_path / update_path).exists():
+                self._say(f"  Warning: Source path not found in template: {update_path}", level='warning')
         
-        updated_files = []
-        skipped_files = []
-        backed_up_files = []
+        record = self._load_template_record(template_repo_url, branch)
+        last_commit = record.get('commit')
+        try:
+            commit = _run_git(['rev-parse', 'HEAD'], cwd=template_repo_path).stdout.strip()
+            if not force and _git_has_commit(template_repo_path, last_commit):
+                # Only paths that changed upstream since the last applied commit can need work
+                output = _run_git(['diff', '--name-only', '-z', '--no-renames', last_commit, commit, '--']
+                                  + pathspecs, cwd=template_repo_path).stdout
+                baseline = True
+                self._say(f"  Comparing {last_commit[:12]}..{commit[:12]}")
+            else:
+                output = _run_git(['ls-files', '-z', '--'] + pathspecs, cwd=template_repo_path).stdout
+                baseline = False
+        except subprocess.CalledProcessError as e:
+            self._say(f"  Error with git operation: {e}", level='error')
+            self._say(f"  Git stderr: {e.stderr}", level='error')
+            return False
         
-        for update_path in update_paths:
-            source_path = template_repo_path / update_path
-            target_path = self.base_dir / update_path
-            
-            if not source_path.exists():
-                print(f"  Warning: Source path not found in template: {update_path}")
-                continue
-            
-            if source_path.is_file():
-                result = self._update_file(source_path, target_path, force, backup)
-                if result['action'] == 'updated':
-                    updated_files.append(update_path)
-                elif result['action'] == 'backed_up':
-                    backed_up_files.append(update_path)
-                elif result['action'] == 'skipped':
-                    skipped_files.append(update_path)
-            elif source_path.is_dir():
-                results = self._update_directory(source_path, target_path, force, backup)
-                updated_files.extend(results['updated'])
-                backed_up_files.extend(results['backed_up'])
-                skipped_files.extend(results['skipped'])
+        results = {'updated': [], 'backed_up': [], 'skipped': [], 'modified': [], 'removed': []}
+        files = record.setdefault('files', {})
+        store = self.backup_store()
+        snapshot = store.begin('update', url=template_repo_url, branch=branch,
+                               from_commit=last_commit, to_commit=commit) if backup else None
+        try:
+            for relative in sorted(path for path in output.split('\0') if path):
+                action = self._update_file(template_repo_path / relative, self.base_dir / relative,
+                                           files.get(relative), baseline, force, snapshot)
+                if action['hash'] is None:
+                    files.pop(relative, None)
+                else:
+                    files[relative] = action['hash']
+                results[action['action']].append(relative)
+            record['commit'] = commit
+        finally:
+            # Also after a failure part way through: what was replaced must stay restorable
+            self._save_template_record(record)
+            self.get_stat_cache().save()
+            if snapshot is not None:
+                self._save_backup_snapshot(store, snapshot)
         
         # Print summary
-        print("\nUpdate Summary:")
-        if updated_files:
-            print(f"  Updated files ({len(updated_files)}):")
-            for file_path in updated_files:
-                print(f"    ✓ {file_path}")
+        self._say("\nUpdate Summary:")
+        if results['updated']:
+            self._say(f"  Updated files ({len(results['updated'])}):")
+            for file_path in results['updated']:
+                self._say(f"    ✓ {file_path}")
+        
+        if results['backed_up']:
+            self._say(f"  Backed up files ({len(results['backed_up'])}):")
+            for file_path in results['backed_up']:
+                self._say(f"    📦 {file_path}")
+        
+        if results['removed']:
+            self._say(f"  Removed files (deleted upstream) ({len(results['removed'])}):")
+            for file_path in results['removed']:
+                self._say(f"    ✗ {file_path}")
         
-        if backed_up_files:
-            print(f"  Backed up files ({len(backed_up_files)}):")
-            for file_path in backed_up_files:
-                print(f"    📦 {file_path}")
+        if results['modified']:
+            self._say(f"  Kept locally modified files (use --force to overwrite) ({len(results['modified'])}):",
+                      level='warning')
+            for file_path in results['modified']:
+                self._say(f"    ✎ {file_path}", level='warning')
         
-        if skipped_files:
-            print(f"  Skipped files (local newer or same) ({len(skipped_files)}):")
-            for file_path in skipped_files:
-                print(f"    ⏭ {file_path}")
+        if results['skipped']:
+            self._say(f"  Skipped files (already up to date) ({len(results['skipped'])}):")
+            for file_path in results['skipped']:
+                self._say(f"    ⏭ {file_path}")
         
-        if not updated_files and not backed_up_files:
-            print("  No files needed updating - local files are up to date!")
+        if not results['updated'] and not results['backed_up'] and not results['removed']:
+            self._say("  No files needed updating - local files are up to date!")
         
         return True
     
-    def _update_file(self, source_path, target_path, force=False, backup=True):
-        """Update a single file if source is newer"""
-        if not target_path.exists():
-            # File doesn't exist locally, copy it
+    def _load_template_record(self, template_repo_url, branch):
+        """Last applied template commit and the hash of every file it wrote (empty if none or for another repo)"""
+        record_path = self.base_dir / PROVISION_CACHE_DIR / TEMPLATE_RECORD_NAME
+        try:
+            with open(record_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            data = None
+        if (not isinstance(data, dict) or data.get('version') != TEMPLATE_RECORD_VERSION
+                or data.get('url') != template_repo_url or data.get('branch') != branch):
+            data = {'version': TEMPLATE_RECORD_VERSION, 'url': template_repo_url, 'branch': branch, 'files': {}}
+        return data
+    
+    def _save_template_record(self, record):
+        """Atomically write the template update record"""
+        cache_dir = self.base_dir / PROVISION_CACHE_DIR
+        cache_dir.mkdir(exist_ok=True)
+        record_path = cache_dir / TEMPLATE_RECORD_NAME
+        temp_path = record_path.with_name(f"{TEMPLATE_RECORD_NAME}.tmp")
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            f.write(json.dumps(record, sort_keys=True, separators=(',', ':')))
+        os.replace(temp_path, record_path)
+    
+    def backup_store(self):
+        """The snapshot store update backs replaced files up into"""
+        return BackupStore(self.base_dir / PROVISION_CACHE_DIR / BACKUP_DIR_NAME)
+    
+    def _backup_file(self, snapshot, target_path, digest):
+        """Add a file to the run's backup snapshot before update overwrites or removes it"""
+        self.backup_store().add(snapshot, target_path.relative_to(self.base_dir).as_posix(), target_path, digest)
+        self._say(f"  Backed up {target_path}")
+    
+    def _save_backup_snapshot(self, store, snapshot):
+        """Save a run's snapshot and apply the default retention"""
+        snapshot_id = store.save(snapshot)
+        if snapshot_id is None:
+            return
+        self._say(f"  Saved backup snapshot {snapshot_id} ({len(snapshot['files'])} files); "
+                  f"restore with: provision.py backups restore {snapshot_id}")
+        removed, _, freed = store.prune(keep=BACKUP_KEEP)
+        if removed:
+            self._say(f"  Pruned {len(removed)} old backup snapshot(s), freed {format_bytes(freed)}")
+    
+    def list_backups(self):
+        """Print the saved backup snapshots, newest first"""
+        store = self.backup_store()
+        snapshots = store.snapshots()
+        if not snapshots:
+            self._say("No backup snapshots.")
+            return
+        self._say("Backup snapshots:")
+        for snapshot in reversed(snapshots):
+            size = sum(entry['size'] for entry in snapshot['files'].values())
+            detail = snapshot['reason']
+            if snapshot.get('to_commit'):
+                detail += f" to {snapshot['to_commit'][:12]}"
+            elif snapshot.get('restored'):
+                detail += f" of {snapshot['restored']}"
+            self._say(f"  {snapshot['id']:<18} {snapshot['created']}  {len(snapshot['files']):5} files  "
+                      f"{format_bytes(size):>9}  {detail}")
+        self._say(f"Store size on disk: {format_bytes(store.stored_size())}")
+    
+    def restore_backup(self, snapshot_id, paths=None):
+        """Write files from a backup snapshot back into the working tree.
+
+        paths limits the restore to those files or directories (relative to the repo root).
+        Files the restore overwrites are snapshotted first, so a restore can be undone.
+        """
+        store = self.backup_store()
+        snapshot = store.load(snapshot_id)
+        prefixes = [path.strip('/') for path in paths or []]
+        selected = {relative: entry for relative, entry in snapshot['files'].items()
+                    if not prefixes or any(relative == prefix or relative.startswith(prefix + '/')
+                                           for prefix in prefixes)}
+        if not selected:
+            raise ValueError(f"No matching files in backup snapshot {snapshot['id']}")
+        
+        undo = store.begin('restore', restored=snapshot['id'])
+        restored = 0
+        try:
+            for relative, entry in sorted(selected.items()):
+                target_path = (self.base_dir / relative).resolve()
+                if self.base_dir.resolve() not in target_path.parents:
+                    raise ValueError(f"Refusing to restore outside the repository: {relative}")
+                if target_path.is_file():
+                    digest = _hash_file(target_path)
+                    if digest == entry['hash']:
+                        continue
+                    store.add(undo, relative, target_path, digest)
+                target_path.parent.mkdir(parents=True, exist_ok=True)
+                temp_path = target_path.with_name(f"{target_path.name}.provision-restore")
+                with open(temp_path, 'wb') as f:
+                    f.write(store.read(entry['hash']))
+                os.chmod(temp_path, entry['mode'])
+                os.replace(temp_path, target_path)
+                self._say(f"  Restored: {relative}")
+                restored += 1
+        finally:
+            undo_id = store.save(undo)
+        self._say(f"Restored {restored} of {len(selected)} file(s) from {snapshot['id']}"
+                  + (f"; previous contents saved as {undo_id}" if undo_id else ""))
+    
+    def prune_backups(self, keep=BACKUP_KEEP, max_age_days=None):
+        """Apply a retention policy to the backup store"""
+        removed, objects, freed = self.backup_store().prune(keep=keep, max_age_days=max_age_days)
+        self._say(f"Removed {len(removed)} snapshot(s) and {objects} stored object(s), freed {format_bytes(freed)}")
+        for snapshot_id in removed:
+            self._say(f"  ✗ {snapshot_id}")
+    
+    def _update_file(self, source_path, target_path, recorded_hash, baseline, force=False, backup=None):
+        """Bring one template file up to date by content hash.
+
+        recorded_hash is what the last update wrote; a local file that no longer matches it was
+        modified locally and is kept unless force is set. Without a baseline (first hash-based
+        update) differing files are overwritten, as the mtime-based update did.
+        Replaced files are added to the backup snapshot, if one is given.
+        Returns the action and the hash to record (None to forget the file).
+        """
+        stat_cache = self.get_stat_cache()
+        target_stat = _regular_stat(target_path)
+        local_hash = stat_cache.hash(target_path, target_stat) if target_stat else None
+        owned = force or not baseline or local_hash == recorded_hash
+        
+        source_stat = _regular_stat(source_path)
+        if source_stat is None:
+            # Deleted upstream
+            if local_hash is None:
+                return {'action': 'skipped', 'hash': None}
+            if not owned:
+                return {'action': 'modified', 'hash': None}
+            if backup is not None:
+                self._backup_file(backup, target_path, local_hash)
+            target_path.unlink()
+            self._say(f"  Removed: {target_path}")
+            return {'action': 'removed', 'hash': None}
+        
+        source_hash = stat_cache.hash(source_path, source_stat)
+        if local_hash is None:
             target_path.parent.mkdir(parents=True, exist_ok=True)
             shutil.copy2(source_path, target_path)
-            print(f"  Added new file: {target_path}")
-            return {'action': 'updated', 'path': str(target_path)}
-        
-        # Get modification times
-        source_mtime = source_path.stat().st_mtime
-        target_mtime = target_path.stat().st_mtime
-        
-        if force or source_mtime > target_mtime:
-            # Source is newer (or force is enabled), update the file
-            if backup and target_path.exists():
-                backup_path = target_path.with_suffix(f"{target_path.suffix}.backup.{int(datetime.now().timestamp())}")
-                shutil.copy2(target_path, backup_path)
-                print(f"  Backed up {target_path} to {backup_path}")
-                
-            shutil.copy2(source_path, target_path)
-            print(f"  Updated: {target_path}")
-            
-            if backup:
-                return {'action': 'backed_up', 'path': str(target_path)}
-            else:
-                return {'action': 'updated', 'path': str(target_path)}
-        else:
-            # Local file is newer or same, skip
-            return {'action': 'skipped', 'path': str(target_path)}
-    
-    def _update_directory(self, source_dir, target_dir, force=False, backup=True):
-        """Update all files in a directory recursively"""
-        results = {'updated': [], 'backed_up': [], 'skipped': []}
-        
-        # Create target directory if it doesn't exist
-        target_dir.mkdir(parents=True, exist_ok=True)
-        
-        # Process each file in the source directory
-        for source_file in source_dir.rglob('*'):
-            if source_file.is_file():
-                # Calculate relative path and corresponding target file
-                relative_path = source_file.relative_to(source_dir)
-                target_file = target_dir / relative_path
+            stat_cache.record(target_path, source_hash)
+            self._say(f"  Added new file: {target_path}")
+            return {'action': 'updated', 'hash': source_hash}
+        if local_hash == source_hash:
+            return {'action': 'skipped', 'hash': source_hash}
+        if not owned:
+            return {'action': 'modified', 'hash': recorded_hash}
+        
+        if backup is not None:
+            self._backup_file(backup, target_path, local_hash)
+        shutil.copy2(source_path, target_path)
+        stat_cache.record(target_path, source_hash)
+        self._say(f"  Updated: {target_path}")
+        return {'action': 'backed_up' if backup is not None else 'updated', 'hash': source_hash}
+    
+    def watch_ai_tools(self, ai_tools, debounce=WATCH_DEBOUNCE, polling=False):
+        """Provision AI tools, then keep their targets in sync while local mapping sources change.
+
+        Each debounced batch re-renders only the targets of changed sources and removes
+        those of deleted ones (see apply_source_changes). A changed provision.map.yaml, or
+        lost inotify events, trigger a full (incremental) provisioning run. Runs until
+        interrupted.
+        """
+        provision_config = self.load_provision_map_config()
+        if not provision_config:
+            raise ValueError("Watch mode requires provision.map.yaml")
+        self.provision_ai_tools(ai_tools)
+        watcher = None
+        try:
+            while True:
+                roots = self._watch_roots(ai_tools, provision_config)
+                watcher = self._start_watcher(roots + [self.provision_map], polling)
+                self._say(f"Watching {len(roots)} source path(s) for {', '.join(ai_tools)} (Ctrl-C to stop)...")
+                while True:
+                    changed = _collect_changes(watcher, debounce)
+                    if changed is None or self.provision_map in changed:
+                        break
+                    start = time.perf_counter()
+                    count = self.apply_source_changes(ai_tools, provision_config, changed)
+                    if count:
+                        self._say(f"Synced {count} file(s) in {(time.perf_counter() - start) * 1000:.1f} ms")
+                watcher.close()
+                if changed is None:
+                    self._say("Change events were lost; re-provisioning", level='warning')
+                else:
+                    try:
+                        provision_config = self.load_provision_map_config()
+                    except ValueError as e:
+                        self._say(f"Error: {e}; keeping the previous configuration", level='error')
+                        continue
+                    self._say("provision.map.yaml changed; re-provisioning")
+                try:
+                    self.provision_ai_tools(ai_tools)
+                except (ValueError, OSError, subprocess.CalledProcessError) as e:
+                    # A bad cycle (e.g. a half-edited mapping) is reported; the next change retries
+                    self._say(f"Error: Re-provisioning failed: {e}", level='error')
+        except KeyboardInterrupt:
+            self._say("Stopped watching.")
+        finally:
+            if watcher is not None:
+                watcher.close()
+    
+    def _watch_roots(self, ai_tools, provision_config):
+        """Existing local mapping sources of the AI tools, without ones nested in another"""
+        roots = sorted({self.base_dir / mapping['source']
+                        for ai_tool in ai_tools
+                        for mapping in provision_config['ai_tools'][ai_tool]['mappings']
+                        if (self.base_dir / mapping['source']).exists()}, key=str)
+        return [root for root in roots if not any(other in root.parents for other in roots)]
+    
+    def _start_watcher(self, roots, polling=False):
+        """inotify watcher, or the mtime-polling fallback when requested or unavailable"""
+        if not polling:
+            try:
+                return InotifyWatcher(roots)
+            except OSError as e:
+                self._say(f"  Warning: inotify unavailable ({e}); polling every {WATCH_POLL_INTERVAL}s instead",
+                          level='warning')
+        return PollingWatcher(roots)
+    
+    def apply_source_changes(self, ai_tools, provision_config, changed):
+        """Bring AI tool targets up to date with a set of changed local source paths.
+
+        Changed files (or every file under a changed directory) are rendered through their
+        mappings' transforms; targets whose source is gone are removed unless modified
+        locally. Targets provisioned from another existing source (overlapping mappings,
+        git repos) are left to full runs. Returns the number of files written or removed.
+        """
+        settings = provision_config.get('settings', {})
+        variables = settings.get('template_vars', {})
+        deleted = [self._manifest_source_key(path) for path in changed if not path.exists()]
+        count = 0
+        for ai_tool in ai_tools:
+            tool_config = provision_config['ai_tools'][ai_tool]
+            target_base = self.target_root / tool_config['target_base']
+            manifest = self._begin_manifest(target_base, {'local'}, [ai_tool])
+            files = manifest['files'] = dict(manifest['previous'])
+            try:
+                tasks = []
+                for mapping in tool_config['mappings']:
+                    source_root = self.base_dir / mapping['source']
+                    target_root = target_base / mapping['target']
+                    renamer = self.get_renamer(mapping.get('file_transforms'))
+                    for path in sorted(changed):
+                        if path != source_root and source_root not in path.parents:
+                            continue
+                        if path.is_dir():
+                            sources = [item for item, _ in walk_files(path)]
+                        else:
+                            sources = [path] if path.is_file() else []
+                        for source in sources:
+                            target = target_root
+                            if source != source_root:
+                                target = target_root / source.relative_to(source_root)
+                            target = renamer.target(source.name, target)
+                            entry = files.get(self._manifest_lookup(target)[1])
+                            if entry and (entry.get('origin', 'local') != 'local'
+                                          or (entry.get('source') != self._manifest_source_key(source)
+                                              and (self.base_dir / entry.get('source', '')).is_file())):
+                                continue
+                            task = self._make_file_task(source, target, variables, settings)
+                            task['tool'] = ai_tool
+                            tasks.append(task)
                 
-                result = self._update_file(source_file, target_file, force, backup)
+                for target_key, entry in sorted(files.items()):
+                    source_key = entry.get('source')
+                    if (self._foreign_entry(manifest, entry) or not source_key
+                            or not any(source_key == key or source_key.startswith(key + '/') for key in deleted)
+                            or (self.base_dir / source_key).exists()):
+                        continue
+                    del files[target_key]
+                    target = target_base / target_key
+                    if not os.path.lexists(target):
+                        continue
+                    if _target_removable(target, entry):
+                        target.unlink()
+                        self._emit('file_removed', target=target, reason='source deleted')
+                        count += 1
+                        for parent in target.parents:
+                            if parent == target_base or next(os.scandir(parent), None) is not None:
+                                break
+                            parent.rmdir()
+                    else:
+                        self._say(f"  Warning: Keeping locally modified file whose source was deleted: {target}",
+                                  level='warning')
                 
-                # Store relative path for reporting
-                relative_str = str(target_dir.name / relative_path)
-                if result['action'] == 'updated':
-                    results['updated'].append(relative_str)
-                elif result['action'] == 'backed_up':
-                    results['backed_up'].append(relative_str)
-                elif result['action'] == 'skipped':
-                    results['skipped'].append(relative_str)
+                results = self._run_file_tasks(tasks)
+                count += sum(1 for result in results if result['action'] in ('copied', 'processed'))
+            finally:
+                self._manifests = []
+                if files != manifest['previous']:
+                    self._write_manifest(target_base, ai_tool, files)
+        
+        self.report_unknown_placeholders()
+        self.report_link_fallbacks()
+        self.save_source_index()
+        return count
+    
+    def provision_fleet(self, target_roots, ai_tools, git_repos=False, no_overwrite=False):
+        """Provision AI tools into many target roots on a process pool.
+
+        Configuration, git repo caches and the source index are prepared once here
+        and shared with every worker. Returns one report row per target, in order.
+        """
+        provision_config = self.load_provision_map_config()
+        if not provision_config:
+            raise ValueError("Fleet provisioning requires provision.map.yaml")
+        for ai_tool in ai_tools:
+            if ai_tool not in provision_config['ai_tools']:
+                raise ValueError(f"Unknown AI tool: {ai_tool}")
+        
+        if git_repos:
+            git_repos_config = provision_config.get('git_repos', {})
+            repo_keys = {repo_key for ai_tool in ai_tools
+                         for repo_key in provision_config['ai_tools'][ai_tool].get('git_repo_mappings', {})}
+            self.start_git_fetches(repo_keys, provision_config)
+            for repo_key in sorted(repo_keys & set(git_repos_config)):
+                self._ensure_git_repo_cached(repo_key, git_repos_config[repo_key], provision_config)
         
-        return results
+        state = {
+            'config': provision_config,
+            'index': self._get_source_index(),
+            'link_mode': self.link_mode,
+            'ai_tools': list(ai_tools),
+            'git_repos': git_repos,
+            'no_overwrite': no_overwrite,
+        }
+        workers = max(1, min(self.jobs, len(target_roots)))
+        self._say(f"Provisioning {len(target_roots)} target(s) with {workers} worker process(es)...")
+        rows = []
+        with self._phase('fleet', total=len(target_roots)):
+            with futures.ProcessPoolExecutor(max_workers=workers, initializer=_init_fleet_worker,
+                                     initargs=(state,)) as pool:
+                for row in pool.map(_provision_fleet_target, [str(root) for root in target_roots]):
+                    index = row.pop('index')
+                    if index:
+                        self._get_source_index().update(index)
+                        self._source_index_dirty = True
+                    written = row['files'].get('copied', 0) + row['files'].get('processed', 0)
+                    detail = row['error'] or (f"{written} written, {row['files'].get('skipped_unchanged', 0)} "
+                                              f"unchanged, {row['failed']} failed")
+                    level = 'info' if row['status'] == 'ok' else 'error'
+                    self._say(f"  {row['status']:<6} {row['target']} ({row['seconds']:.2f}s): {detail}", level=level)
+                    rows.append(row)
+        self.save_source_index()
+        
+        failed = sum(1 for row in rows if row['status'] != 'ok')
+        self._say(f"Fleet provisioning completed: {len(rows) - failed} succeeded, {failed} failed")
+        return rows
+
+
+# Set in each fleet worker process by _init_fleet_worker
+_fleet_state = None
+
+
+def _init_fleet_worker(state):
+    """Process pool initializer: keep the parent's parsed config and source index in this worker"""
+    global _fleet_state
+    _fleet_state = state
+
+
+def _provision_fleet_target(target_root):
+    """Provision one fleet target root inside a worker process and report how it went"""
+    state = _fleet_state
+    collector = JsonSummaryReporter()
+    row = {'target': target_root, 'status': 'ok', 'seconds': 0.0, 'files': {}, 'failed': 0,
+           'warnings': [], 'error': None, 'index': None}
+    start = time.perf_counter()
+    # Workers run files serially: the fleet is parallel across targets instead
+    provisioner = TemplateProvisioner(jobs=1, link_mode=state['link_mode'], reporter=collector,
+                                      target_root=target_root)
+    provisioner.provision_config = state['config']
+    provisioner.fetch_git_repos = False
+    provisioner.persist_source_index = False
+    provisioner._source_index = state['index']
+    try:
+        if not Path(target_root).is_dir():
+            raise FileNotFoundError(f"Target root not found: {target_root}")
+        provisioner.provision_ai_tools(state['ai_tools'], git_repos=state['git_repos'],
+                                       no_overwrite=state['no_overwrite'])
+    except (ValueError, OSError) as e:
+        row['status'] = 'error'
+        row['error'] = str(e)
+    except Exception as e:
+        # Anything else (e.g. a git CalledProcessError) fails this target only, not the fleet
+        row['status'] = 'error'
+        row['error'] = f"{type(e).__name__}: {e}"
+    finally:
+        provisioner.close()
+    row['seconds'] = time.perf_counter() - start
+    row['files'] = collector.files
+    row['failed'] = len(provisioner.failed_files)
+    row['warnings'] = collector.messages['warning']
+    if row['failed'] and row['status'] == 'ok':
+        row['status'] = 'failed'
+    if provisioner._source_index_dirty:
+        row['index'] = provisioner._source_index
+    return row
+
+
+def read_targets_file(path):
+    """Target roots listed one per line; blank lines and # comments are ignored"""
+    targets = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.split('#', 1)[0].strip()
+            if line:
+                targets.append(Path(line).expanduser())
+    return targets
 
 
 def main():
     parser = argparse.ArgumentParser(description='Provision AI tool templates and project types')
+    parser.add_argument('--profile', metavar='TRACE',
+                        help='Time each phase, mapping and file, print a summary and write a Chrome trace '
+                             '(chrome://tracing, ui.perfetto.dev) to TRACE')
+    parser.add_argument('--profile-python', action='store_true',
+                        help='With --profile, also capture a cProfile of the main thread (saved next to TRACE)')
+    parser.add_argument('--profile-memory', action='store_true',
+                        help='With --profile, also trace Python memory allocations (tracemalloc)')
     subparsers = parser.add_subparsers(dest='command', help='Available commands')
 
     # List command
@@ -810,7 +3850,9 @@ def main():
     # Provision command
     provision_parser = subparsers.add_parser('provision', help='Provision templates')
     provision_parser.add_argument('--ai-tool', '-t', 
-                                help='AI tool to provision (claude-code, copilot)')
+                                help='AI tool(s) to provision, comma-separated (claude-code, copilot)')
+    provision_parser.add_argument('--all-tools', action='store_true',
+                                help='Provision every AI tool configured in provision.map.yaml')
     provision_parser.add_argument('--project-type', '-p',
                                 help='Project type to provision (docusaurus, mkdocs, minimal)')
     provision_parser.add_argument('--concurrent', action='store_true',
@@ -819,6 +3861,23 @@ def main():
                                 help='Include git repository integrations')
     provision_parser.add_argument('--no-overwrite', action='store_true',
                                 help='Do not overwrite existing files from git repos (default: overwrite)')
+    provision_parser.add_argument('--dry-run', action='store_true',
+                                help='Print the provisioning plan and predicted changes without writing anything')
+    provision_parser.add_argument('--jobs', '-j', type=int,
+                                help='Number of parallel file-copy workers (default: CPU count + 4, 1 = serial)')
+    provision_parser.add_argument('--executor', choices=EXECUTOR_TYPES, default='thread',
+                                help='Worker pool type for file copies (default: thread)')
+    provision_parser.add_argument('--link-mode', choices=LINK_MODES, default='copy',
+                                help='How to place files that need no substitution: zero-copy copy (default), '
+                                     'hardlink or symlink to the source, or reflink clone; falls back to copy '
+                                     'where unsupported')
+    output_group = provision_parser.add_mutually_exclusive_group()
+    output_group.add_argument('--verbose', '-v', action='store_true',
+                              help='Print a line for every file (default: progress bar on a terminal)')
+    output_group.add_argument('--quiet', '-q', action='store_true',
+                              help='Only print warnings and errors')
+    output_group.add_argument('--json', action='store_true',
+                              help='Print a JSON summary of counts, phase timings, warnings and failures')
     provision_parser.add_argument('--project-name', default='my-project',
                                 help='Project name for variable substitution')
     provision_parser.add_argument('--project-title', 
@@ -830,15 +3889,58 @@ def main():
     provision_parser.add_argument('--project-repo-url', 
                                 help='Project repository URL for variable substitution')
 
+    # Fleet command
+    fleet_parser = subparsers.add_parser('fleet', help='Provision AI tools into many target repositories')
+    fleet_parser.add_argument('--targets-file', required=True,
+                              help='File listing target repository roots, one per line (# comments allowed)')
+    fleet_parser.add_argument('--ai-tool', '-t',
+                              help='AI tool(s) to provision, comma-separated (claude-code, copilot)')
+    fleet_parser.add_argument('--all-tools', action='store_true',
+                              help='Provision every AI tool configured in provision.map.yaml')
+    fleet_parser.add_argument('--git-repos', action='store_true',
+                              help='Include git repository integrations (fetched once for the whole fleet)')
+    fleet_parser.add_argument('--no-overwrite', action='store_true',
+                              help='Do not overwrite existing files from git repos (default: overwrite)')
+    fleet_parser.add_argument('--jobs', '-j', type=int,
+                              help='Number of worker processes (default: CPU count)')
+    fleet_parser.add_argument('--link-mode', choices=LINK_MODES, default='copy',
+                              help='How to place files that need no substitution (see provision --link-mode)')
+    fleet_parser.add_argument('--json', action='store_true',
+                              help='Print the per-target report as JSON')
+
+    # Watch command
+    watch_parser = subparsers.add_parser('watch', help='Provision AI tools and re-provision changed sources live')
+    watch_parser.add_argument('--ai-tool', '-t',
+                              help='AI tool(s) to keep in sync, comma-separated (claude-code, copilot)')
+    watch_parser.add_argument('--all-tools', action='store_true',
+                              help='Watch every AI tool configured in provision.map.yaml')
+    watch_parser.add_argument('--debounce', type=float, default=WATCH_DEBOUNCE,
+                              help=f'Seconds to wait for changes to settle (default: {WATCH_DEBOUNCE})')
+    watch_parser.add_argument('--poll', action='store_true',
+                              help='Poll mtimes instead of using inotify')
+    watch_parser.add_argument('--link-mode', choices=LINK_MODES, default='copy',
+                              help='How to place files that need no substitution (see provision --link-mode)')
+
     # Clean command
     clean_parser = subparsers.add_parser('clean', help='Clean provisioned files')
     clean_parser.add_argument('--ai-tool', '-t', required=True,
-                            help='AI tool to clean (claude-code, copilot)')
+                            help='AI tool(s) to clean, comma-separated (claude-code, copilot)')
+    clean_parser.add_argument('--jobs', '-j', type=int,
+                            help='Number of parallel file removal workers (default: CPU count + 4, 1 = serial)')
 
     # Pull external repo resources command
     pull_repo_parser = subparsers.add_parser('pull-repo', help='Pull resources from external repo')
     pull_repo_parser.add_argument('--repo', required=True, help='Repo key from external-resources.map.yaml')
     pull_repo_parser.add_argument('--target-dir', required=True, help='Target directory in client project')
+    pull_repo_parser.add_argument('--checksum', action='store_true',
+                                  help='Compare file contents even when size and mtime match')
+    pull_repo_parser.add_argument('--full-copy', action='store_true',
+                                  help='Replace each folder with a fresh copy instead of syncing changes')
+
+    # Lock command
+    lock_parser = subparsers.add_parser('lock', help=f'Pin git repo and external repo commits in {LOCK_NAME}')
+    lock_parser.add_argument('--update', action='store_true',
+                             help='Move every pin to the current commit of its branch (default: add missing pins)')
 
     # Update command
     update_parser = subparsers.add_parser('update', help='Update local files from agentic-template repository')
@@ -847,17 +3949,57 @@ def main():
     update_parser.add_argument('--branch', default='main',
                               help='Branch to pull from (default: main)')
     update_parser.add_argument('--force', action='store_true',
-                              help='Force update all files regardless of modification time')
+                              help='Compare every template file and overwrite local modifications')
     update_parser.add_argument('--no-backup', action='store_true',
-                              help='Do not create backup files (default: create backups)')
+                              help='Do not snapshot replaced files (default: save a backup snapshot)')
+
+    # Backups command
+    backups_parser = subparsers.add_parser('backups', help='List, restore or prune update backup snapshots')
+    backups_subparsers = backups_parser.add_subparsers(dest='backups_command', required=True)
+    backups_subparsers.add_parser('list', help='List backup snapshots')
+    restore_parser = backups_subparsers.add_parser('restore', help='Restore files from a backup snapshot')
+    restore_parser.add_argument('snapshot', help="Snapshot id (or 'latest')")
+    restore_parser.add_argument('paths', nargs='*',
+                                help='Files or directories to restore (default: the whole snapshot)')
+    prune_parser = backups_subparsers.add_parser('prune', help='Delete old backup snapshots')
+    prune_parser.add_argument('--keep', type=int, default=BACKUP_KEEP,
+                              help=f'Number of newest snapshots to keep (default: {BACKUP_KEEP})')
+    prune_parser.add_argument('--max-age', type=float, metavar='DAYS',
+                              help='Also delete snapshots older than this many days')
 
     args = parser.parse_args()
 
     if not args.command:
         parser.print_help()
         return 1
+    if (args.profile_python or args.profile_memory) and not args.profile:
+        parser.error("--profile-python and --profile-memory need --profile")
 
-    provisioner = TemplateProvisioner()
+    if args.command == 'fleet':
+        # With --json, stdout carries only the report
+        reporter = ConsoleReporter(verbose=False, quiet=args.json, stream=sys.stderr if args.json else None)
+    elif getattr(args, 'json', False):
+        reporter = JsonSummaryReporter()
+    elif getattr(args, 'quiet', False):
+        reporter = ConsoleReporter(verbose=False, quiet=True)
+    elif args.command != 'provision' or getattr(args, 'verbose', False) or getattr(args, 'dry_run', False):
+        reporter = ConsoleReporter()
+    elif sys.stderr.isatty():
+        reporter = ProgressReporter()
+    else:
+        reporter = ConsoleReporter(verbose=False)
+    jobs = getattr(args, 'jobs', None)
+    if args.command == 'fleet' and not jobs:
+        jobs = os.cpu_count() or 1
+    provisioner = TemplateProvisioner(
+        jobs=jobs,
+        executor=getattr(args, 'executor', 'thread'),
+        link_mode=getattr(args, 'link_mode', 'copy'),
+        reporter=reporter
+    )
+    provisioner.write_caches = not getattr(args, 'dry_run', False)
+    if args.profile:
+        provisioner.profiler = Profiler(python=args.profile_python, memory=args.profile_memory)
 
     try:
         if args.command == 'list':
@@ -886,19 +4028,59 @@ def main():
                 'PROJECT_TAGLINE': args.project_description,
             }
             if args.project_type:
-                provisioner.provision_project_type(args.project_type, variables)
-            if args.ai_tool:
+                provisioner.provision_project_type(args.project_type, variables, dry_run=args.dry_run)
+            if args.all_tools:
+                ai_tools = provisioner.list_available_ai_tools()
+            else:
+                ai_tools = [tool.strip() for tool in (args.ai_tool or '').split(',') if tool.strip()]
+            if ai_tools:
                 # Pass git repos and overwrite flags to provisioning
                 git_repos = getattr(args, 'git_repos', False)
                 no_overwrite = getattr(args, 'no_overwrite', False)
-                provisioner.provision_ai_tool(args.ai_tool, args.concurrent, git_repos, no_overwrite)
-            if not args.project_type and not args.ai_tool:
-                print("Error: Specify either --project-type or --ai-tool (or both)")
+                provisioner.provision_ai_tools(ai_tools, args.concurrent, git_repos, no_overwrite,
+                                               dry_run=args.dry_run)
+            if not args.project_type and not ai_tools:
+                print("Error: Specify either --project-type or --ai-tool/--all-tools (or both)")
+                return 1
+            if provisioner.failed_files or provisioner.failed_git_repos:
+                return 1
+        elif args.command == 'fleet':
+            targets = read_targets_file(args.targets_file)
+            if not targets:
+                print(f"Error: No target roots listed in {args.targets_file}")
+                return 1
+            if args.all_tools:
+                ai_tools = provisioner.list_available_ai_tools()
+            else:
+                ai_tools = [tool.strip() for tool in (args.ai_tool or '').split(',') if tool.strip()]
+            if not ai_tools:
+                print("Error: Specify --ai-tool or --all-tools")
+                return 1
+            rows = provisioner.provision_fleet(targets, ai_tools, args.git_repos, args.no_overwrite)
+            if args.json:
+                print(json.dumps(rows, indent=2))
+            if provisioner.failed_git_repos or any(row['status'] != 'ok' for row in rows):
+                return 1
+        elif args.command == 'watch':
+            if args.all_tools:
+                ai_tools = provisioner.list_available_ai_tools()
+            else:
+                ai_tools = [tool.strip() for tool in (args.ai_tool or '').split(',') if tool.strip()]
+            if not ai_tools:
+                print("Error: Specify --ai-tool or --all-tools")
                 return 1
+            provisioner.watch_ai_tools(ai_tools, debounce=args.debounce, polling=args.poll)
         elif args.command == 'clean':
-            provisioner.clean_provisioned_files(args.ai_tool)
+            for ai_tool in [tool.strip() for tool in args.ai_tool.split(',') if tool.strip()]:
+                provisioner.clean_provisioned_files(ai_tool)
+            if provisioner.failed_files:
+                return 1
         elif args.command == 'pull-repo':
-            provisioner.pull_external_repo(args.repo, args.target_dir)
+            if not provisioner.pull_external_repo(args.repo, args.target_dir, args.checksum, args.full_copy):
+                return 1
+        elif args.command == 'lock':
+            if not provisioner.lock_repos(update=args.update):
+                return 1
         elif args.command == 'update':
             backup = not args.no_backup
             success = provisioner.update_from_template_repo(
@@ -910,12 +4092,24 @@ def main():
             if not success:
                 print("Update failed!")
                 return 1
+        elif args.command == 'backups':
+            if args.backups_command == 'list':
+                provisioner.list_backups()
+            elif args.backups_command == 'restore':
+                provisioner.restore_backup(args.snapshot, args.paths)
+            elif args.backups_command == 'prune':
+                provisioner.prune_backups(keep=args.keep, max_age_days=args.max_age)
     except ValueError as e:
         print(f"Error: {e}")
         return 1
     except FileNotFoundError as e:
         print(f"File not found: {e}")
         return 1
+    finally:
+        provisioner.close()
+        if provisioner.profiler is not None:
+            provisioner.write_profile(args.profile)
+        reporter.close()
     return 0
 
 if __name__ == "__main__":
@@ -0,0 +1,340 @@
+#!/usr/bin/env python3
+"""
+Provisioning Benchmark Suite
+Times provision.py end to end on a generated synthetic tree and on the real common/ corpus:
+cold and warm provisioning, git repo mappings, `update`, and in-process substitution
+throughput. Results can be saved as JSON and compared against a saved baseline, failing
+when any benchmark got slower than the regression threshold allows.
+"""
+
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_ROOT))
+
+from provision import VariableSubstituter  # noqa: E402
+
+RESULTS_VERSION = 1
+SCENARIOS = ['substitution', 'synthetic', 'common', 'git-mapping', 'update']
+TEMPLATE_VARS = {
+    'PROJECT_NAME': 'bench-project',
+    'PROJECT_TITLE': 'Bench Project',
+    'ORG': 'Acme',
+    'OWNER_EMAIL': 'dev@acme.com',
+}
+WORDS = ('agent', 'template', 'provision', 'mapping', 'persona', 'instruction', 'workflow', 'review',
+         'the', 'a', 'of', 'and', 'to', 'with', 'for', 'each', 'file', 'target', 'source', 'build')
+GIT_ENV = dict(os.environ, GIT_AUTHOR_NAME='bench', GIT_AUTHOR_EMAIL='bench@example.com',
+               GIT_COMMITTER_NAME='bench', GIT_COMMITTER_EMAIL='bench@example.com')
+
+
+def random_size(rng, min_size, max_size):
+    """Log-uniform file size: many small files, a long tail of large ones"""
+    return int(math.exp(rng.uniform(math.log(min_size), math.log(max_size))))
+
+
+def random_text(rng, size, placeholder_density):
+    """About size bytes of markdown-ish text with placeholder_density {{KEY}} references per KB"""
+    names = list(TEMPLATE_VARS)
+    lines = []
+    written = 0
+    while written < size:
+        words = [rng.choice(WORDS) for _ in range(rng.randint(4, 14))]
+        if rng.random() < placeholder_density * 80 / 1024:  # ~80 bytes per line
+            words.insert(rng.randrange(len(words)), f"{{{{{rng.choice(names)}}}}}")
+        line = ' '.join(words)
+        lines.append(line)
+        written += len(line) + 1
+    return '\n'.join(lines) + '\n'
+
+
+def generate_corpus(root, files, min_size, max_size, binary_ratio, placeholder_density, seed):
+    """Write a synthetic source tree under root; returns (file count, total bytes)"""
+    rng = random.Random(seed)
+    total = 0
+    for index in range(files):
+        directory = root / f"group-{index % 16:02d}" / f"set-{index % 5}"
+        directory.mkdir(parents=True, exist_ok=True)
+        size = random_size(rng, min_size, max_size)
+        if rng.random() < binary_ratio:
+            path = directory / f"asset-{index:05d}.png"
+            path.write_bytes(b'\x89PNG\r\n\x1a\n\x00' + rng.randbytes(size))
+        else:
+            suffix = '.prompt.md' if index % 7 == 0 else '.md'
+            path = directory / f"doc-{index:05d}{suffix}"
+            path.write_text(random_text(rng, size, placeholder_density), encoding='utf-8')
+        total += path.stat().st_size
+    return files, total
+
+
+def write_config(workspace, git_url=None):
+    """provision.map.yaml for the synthetic corpus (JSON is valid YAML)"""
+    tool = {
+        'name': 'Bench',
+        'target_base': '.bench',
+        'mappings': [{
+            'source': 'common/bench/',
+            'target': 'content/',
+            'file_transforms': [{'from_extension': '.prompt.md', 'to_extension': '.md'},
+                                {'preserve_others': True}],
+        }],
+    }
+    config = {
+        'ai_tools': {'bench': tool},
+        'settings': {'clean_target_dirs': False, 'template_vars': TEMPLATE_VARS},
+    }
+    if git_url:
+        config['git_repos'] = {'bench-repo': {'url': git_url, 'branch': 'main', 'folders': ['docs']}}
+        tool['git_repo_mappings'] = {'bench-repo': {'mappings': [{'source': 'docs/', 'target': 'git/'}]}}
+    (workspace / 'provision.map.yaml').write_text(json.dumps(config, indent=2), encoding='utf-8')
+
+
+def git(args, cwd):
+    subprocess.run(['git'] + args, cwd=cwd, env=GIT_ENV, check=True, capture_output=True)
+
+
+def make_git_repo(path, source, prefix):
+    """A local git repo on branch main holding a copy of source under prefix"""
+    shutil.copytree(source, path / prefix)
+    git(['init', '-q', '-b', 'main'], path)
+    git(['add', '-A'], path)
+    git(['commit', '-q', '-m', 'corpus'], path)
+
+
+def touch_upstream(repo, prefix, count, round_number):
+    """Commit a change to count text files of a template repo"""
+    changed = sorted((repo / prefix).rglob('*.md'))[:count]
+    for path in changed:
+        with open(path, 'a', encoding='utf-8') as f:
+            f.write(f"upstream change {round_number}\n")
+    git(['commit', '-q', '-a', '-m', f"change {round_number}"], repo)
+
+
+def run_provision(workspace, args):
+    """Run provision.py in workspace; returns (seconds, JSON summary or None)"""
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, 'provision.py'] + args, cwd=workspace,
+                            capture_output=True, text=True)
+    elapsed = time.perf_counter() - start
+    if result.returncode != 0:
+        raise RuntimeError(f"provision.py {' '.join(args)} failed:\n{result.stdout}{result.stderr}")
+    summary = json.loads(result.stdout) if '--json' in args else None
+    return elapsed, summary
+
+
+def reset(workspace, *names):
+    """Remove targets and caches so the next run is cold"""
+    for name in names:
+        path = workspace / name
+        if path.is_dir():
+            shutil.rmtree(path)
+        elif path.exists():
+            path.unlink()
+
+
+def measure(repeat, prepare, run):
+    """Best/median of repeat runs; prepare() runs untimed before each"""
+    runs = []
+    details = None
+    for _ in range(repeat):
+        prepare()
+        elapsed, details = run()
+        runs.append(elapsed)
+    ordered = sorted(runs)
+    result = {'seconds': ordered[0], 'median': ordered[len(ordered) // 2], 'runs': runs}
+    if details:
+        result['files'] = details.get('files', {})
+        result['phases'] = details.get('phases', [])
+    return result
+
+
+def bench_substitution(args, workspace):
+    rng = random.Random(args.seed)
+    documents = [random_text(rng, random_size(rng, args.min_size, args.max_size), args.placeholder_density)
+                 for _ in range(min(args.files, 500))]
+    megabytes = sum(len(document.encode('utf-8')) for document in documents) / (1024 * 1024)
+    substituter = VariableSubstituter(TEMPLATE_VARS)
+
+    def run():
+        start = time.perf_counter()
+        for document in documents:
+            substituter.substitute(document)
+        return time.perf_counter() - start, None
+
+    result = measure(args.repeat, lambda: None, run)
+    result['mb_per_s'] = megabytes / result['seconds']
+    return {'substitution': result}
+
+
+def bench_synthetic(args, workspace):
+    provision_args = ['provision', '--ai-tool', 'bench', '--json']
+    cold = measure(args.repeat, lambda: reset(workspace, '.bench', '.provision_cache'),
+                   lambda: run_provision(workspace, provision_args))
+    warm = measure(args.repeat, lambda: None, lambda: run_provision(workspace, provision_args))
+    return {'synthetic-cold': cold, 'synthetic-warm': warm}
+
+
+def bench_common(args, workspace):
+    real = workspace.parent / 'common-workspace'
+    real.mkdir()
+    shutil.copy2(REPO_ROOT / 'provision.py', real)
+    for name in ('provision.map.yaml', 'map.yaml'):
+        shutil.copy2(REPO_ROOT / name, real)
+    for name in ('common', 'templates'):
+        shutil.copytree(REPO_ROOT / name, real / name, symlinks=True)
+    provision_args = ['provision', '--ai-tool', 'claude-code,copilot', '--json']
+    cold = measure(args.repeat, lambda: reset(real, '.claude', '.github', '.provision_cache'),
+                   lambda: run_provision(real, provision_args))
+    warm = measure(args.repeat, lambda: None, lambda: run_provision(real, provision_args))
+    return {'common-cold': cold, 'common-warm': warm}
+
+
+def bench_git_mapping(args, workspace):
+    repo = workspace.parent / 'git-source'
+    make_git_repo(repo, workspace / 'common' / 'bench', 'docs')
+    write_config(workspace, git_url=str(repo))
+    provision_args = ['provision', '--ai-tool', 'bench', '--git-repos', '--json']
+    try:
+        cold = measure(args.repeat,
+                       lambda: reset(workspace, '.bench', '.provision_cache', '.git_repo_cache', 'provision.lock'),
+                       lambda: run_provision(workspace, provision_args))
+        warm = measure(args.repeat, lambda: None, lambda: run_provision(workspace, provision_args))
+    finally:
+        write_config(workspace)
+        reset(workspace, '.bench', '.git_repo_cache', 'provision.lock')
+    return {'git-mapping-cold': cold, 'git-mapping-warm': warm}
+
+
+def bench_update(args, workspace):
+    repo = workspace.parent / 'template-source'
+    make_git_repo(repo, workspace / 'common' / 'bench', 'common/bench')
+    update_args = ['update', '--repo-url', str(repo), '--no-backup']
+    rounds = iter(range(args.repeat))
+    try:
+        full = measure(args.repeat, lambda: reset(workspace, '.template_repo_cache', '.provision_cache'),
+                       lambda: run_provision(workspace, update_args))
+        incremental = measure(args.repeat, lambda: touch_upstream(repo, 'common/bench', 5, next(rounds)),
+                              lambda: run_provision(workspace, update_args))
+    finally:
+        reset(workspace, '.template_repo_cache')
+    return {'update-full': full, 'update-incremental': incremental}
+
+
+BENCHMARKS = {
+    'substitution': bench_substitution,
+    'synthetic': bench_synthetic,
+    'common': bench_common,
+    'git-mapping': bench_git_mapping,
+    'update': bench_update,
+}
+
+
+def compare(results, baseline, threshold):
+    """Print each benchmark against the baseline; returns the names that regressed"""
+    regressions = []
+    print(f"\nCompared with baseline (threshold {threshold:.0%}):")
+    for name, result in results.items():
+        previous = baseline.get(name)
+        if not previous:
+            print(f"  {name:<22} (not in baseline)")
+            continue
+        change = result['seconds'] / previous['seconds'] - 1
+        regressed = change > threshold
+        print(f"  {name:<22} {previous['seconds'] * 1000:9.1f} ms -> {result['seconds'] * 1000:9.1f} ms  "
+              f"{change:+7.1%}{'  REGRESSION' if regressed else ''}")
+        if regressed:
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark provision.py on synthetic and real corpora')
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS),
+                        help=f"Comma-separated benchmarks to run (default: {','.join(SCENARIOS)})")
+    parser.add_argument('--files', type=int, default=2000, help='Files in the synthetic tree')
+    parser.add_argument('--min-size', type=int, default=256, help='Smallest synthetic file in bytes')
+    parser.add_argument('--max-size', type=int, default=64 * 1024,
+                        help='Largest synthetic file in bytes (sizes are log-uniform in between)')
+    parser.add_argument('--binary-ratio', type=float, default=0.1, help='Fraction of binary synthetic files')
+    parser.add_argument('--placeholder-density', type=float, default=2.0,
+                        help='{{KEY}} placeholders per KB of synthetic text')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed of the generator')
+    parser.add_argument('--repeat', type=int, default=3, help='Timed runs per benchmark; the best one is compared')
+    parser.add_argument('--output', help='Write the results as JSON to this file')
+    parser.add_argument('--baseline', help='Results JSON of an earlier run to compare against')
+    parser.add_argument('--threshold', type=float, default=0.15,
+                        help='Allowed slowdown against the baseline before failing (default: 0.15 = 15%%)')
+    parser.add_argument('--keep', action='store_true', help='Keep the generated workspace and print its path')
+    args = parser.parse_args()
+
+    scenarios = [name.strip() for name in args.scenarios.split(',') if name.strip()]
+    unknown = [name for name in scenarios if name not in BENCHMARKS]
+    if unknown:
+        print(f"Error: Unknown benchmark(s): {', '.join(unknown)}")
+        return 1
+
+    root = Path(tempfile.mkdtemp(prefix='provision-bench-'))
+    workspace = root / 'workspace'
+    (workspace / 'common').mkdir(parents=True)
+    shutil.copy2(REPO_ROOT / 'provision.py', workspace)
+    count, total = generate_corpus(workspace / 'common' / 'bench', args.files, args.min_size, args.max_size,
+                                   args.binary_ratio, args.placeholder_density, args.seed)
+    write_config(workspace)
+    print(f"Synthetic corpus: {count} files, {total / (1024 * 1024):.1f} MB in {workspace}")
+
+    results = {}
+    try:
+        for name in scenarios:
+            print(f"Running {name}...")
+            results.update(BENCHMARKS[name](args, workspace))
+    finally:
+        if args.keep:
+            print(f"Workspace kept at {root}")
+        else:
+            shutil.rmtree(root, ignore_errors=True)
+
+    print("\nResults (best of {}):".format(args.repeat))
+    for name, result in results.items():
+        extra = f"  {result['mb_per_s']:8.1f} MB/s" if 'mb_per_s' in result else ''
+        print(f"  {name:<22} {result['seconds'] * 1000:9.1f} ms  (median {result['median'] * 1000:.1f} ms){extra}")
+
+    report = {
+        'version': RESULTS_VERSION,
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'parameters': {key: getattr(args, key) for key in ('files', 'min_size', 'max_size', 'binary_ratio',
+                                                          'placeholder_density', 'seed', 'repeat')},
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(json.dumps(report, indent=2, sort_keys=True) + '\n')
+        print(f"\nResults written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        if baseline.get('parameters') != report['parameters']:
+            print("Warning: Baseline was recorded with different parameters")
+        regressions = compare(results, baseline.get('results', {}), args.threshold)
+        if regressions:
+            print(f"\nError: {len(regressions)} benchmark(s) regressed: {', '.join(regressions)}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
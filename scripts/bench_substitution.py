@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Substitution Microbenchmark
+Measures {{KEY}} substitution throughput of provision.py on the common/instructions corpus,
+comparing the per-variable str.replace loop with the compiled single-pass substituter.
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_ROOT))
+
+from provision import VariableSubstituter  # noqa: E402
+
+
+def load_corpus(corpus_dir):
+    """Read every UTF-8 text file under corpus_dir"""
+    documents = []
+    for path in sorted(corpus_dir.rglob('*')):
+        if not path.is_file():
+            continue
+        try:
+            documents.append(path.read_text(encoding='utf-8'))
+        except UnicodeDecodeError:
+            continue
+    return documents
+
+
+def build_variables(extra_vars):
+    """The CLI's project variables, padded with synthetic ones to show how cost scales"""
+    variables = {
+        'PROJECT_NAME': 'bench-project',
+        'PROJECT_TITLE': 'Bench Project',
+        'PROJECT_DESCRIPTION': 'A benchmark project',
+        'PROJECT_URL': 'https://example.com',
+        'PROJECT_REPO_URL': 'https://github.com/example/bench-project',
+        'PROJECT_BASE_URL': '/',
+        'PROJECT_TAGLINE': 'A benchmark project',
+        'ORG': 'Acme',
+        'OWNER_EMAIL': 'dev@acme.com',
+    }
+    for index in range(extra_vars):
+        variables[f"BENCH_VAR_{index}"] = f"value-{index}"
+    return variables
+
+
+def legacy_substitute(content, variables):
+    """The original implementation: one full str.replace pass per variable"""
+    for key, value in variables.items():
+        content = content.replace(f"{{{{{key}}}}}", str(value))
+    return content
+
+
+def time_best(function, repeat):
+    """Best wall time of ``repeat`` runs"""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark template variable substitution')
+    parser.add_argument('--corpus', default=str(REPO_ROOT / 'common' / 'instructions'),
+                        help='Directory of text files to substitute (default: common/instructions)')
+    parser.add_argument('--extra-vars', type=int, default=0,
+                        help='Number of synthetic variables to add to the variable set')
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='Number of timed runs; the best one is reported')
+    args = parser.parse_args()
+
+    documents = load_corpus(Path(args.corpus))
+    if not documents:
+        print(f"Error: No text files found in {args.corpus}")
+        return 1
+    variables = build_variables(args.extra_vars)
+    total_bytes = sum(len(document.encode('utf-8')) for document in documents)
+
+    substituter = VariableSubstituter(variables)
+    for document in documents:
+        if substituter.substitute(document) != legacy_substitute(document, variables):
+            print("Error: Compiled substitution differs from the legacy implementation")
+            return 1
+
+    legacy_time = time_best(lambda: [legacy_substitute(d, variables) for d in documents], args.repeat)
+    compiled_time = time_best(lambda: [substituter.substitute(d) for d in documents], args.repeat)
+    compile_time = time_best(lambda: VariableSubstituter(variables), args.repeat)
+
+    megabytes = total_bytes / (1024 * 1024)
+    print(f"Corpus: {args.corpus} ({len(documents)} files, {megabytes:.2f} MB)")
+    print(f"Variables: {len(variables)}")
+    print(f"  legacy str.replace loop: {legacy_time * 1000:8.2f} ms  {megabytes / legacy_time:8.1f} MB/s")
+    print(f"  compiled single pass:    {compiled_time * 1000:8.2f} ms  {megabytes / compiled_time:8.1f} MB/s")
+    print(f"  compile once:            {compile_time * 1000:8.3f} ms")
+    print(f"  speedup: {legacy_time / compiled_time:.1f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())